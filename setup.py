@@ -52,5 +52,6 @@ setup(
     entry_points="""
     [console_scripts]
     testldap = node.ext.ldap.main:slapd
+    ldap_warmup = node.ext.ldap.ugm.warmup:main
     """,
 )
@@ -2,9 +2,12 @@
 from node.ext.ldap.scope import BASE
 from node.ext.ldap.scope import ONELEVEL
 from node.ext.ldap.scope import SUBTREE
+from node.ext.ldap.pool import LDAPConnectionPool
 from node.ext.ldap.base import LDAPCommunicator
 from node.ext.ldap.base import LDAPConnector
+from node.ext.ldap.base import LDAPRequest
 from node.ext.ldap.base import testLDAPConnectivity
+from node.ext.ldap.session import AsyncLDAPSession
 from node.ext.ldap.session import LDAPSession
 from node.ext.ldap._node import LDAPNode
 from node.ext.ldap._node import LDAPNodeAttributes
@@ -74,25 +74,29 @@ class LDAPAttributesBehavior(Behavior):
         # if self.session._props.memberOfSupport:
         #    attrlist.append('memberOf')
 
-        # fetch attributes for ldap_node
-        xentry = ldap_node.ldap_session.search(
-            scope=BASE,
-            baseDN=ldap_node.DN.encode('utf-8'),
-            force_reload=ldap_node._reload,
-            attrlist=attrlist,
-        )
-        if len(xentry) > 1:
-            entry = xentry[:1]
-        if len(xentry) == 1:
-            entry = xentry
-        # result length must be 1
-        if len(entry) != 1:
-            raise RuntimeError(                            # pragma NO COVERAGE
-                u"Fatal. Expected entry does not exist "   # pragma NO COVERAGE
-                u"or more than one entry found"            # pragma NO COVERAGE
-            )                                              # pragma NO COVERAGE
+        # use attributes prefetched while iterating parent, only once
+        attrs = ldap_node._prefetched
+        ldap_node._prefetched = None
+        if attrs is None or ldap_node._reload:
+            # fetch attributes for ldap_node
+            xentry = ldap_node.ldap_session.search(
+                scope=BASE,
+                baseDN=ldap_node.DN.encode('utf-8'),
+                force_reload=ldap_node._reload,
+                attrlist=attrlist,
+            )
+            if len(xentry) > 1:
+                entry = xentry[:1]
+            if len(xentry) == 1:
+                entry = xentry
+            # result length must be 1
+            if len(entry) != 1:
+                raise RuntimeError(                        # pragma NO COVERAGE
+                    u"Fatal. Expected entry does not "     # pragma NO COVERAGE
+                    u"exist or more than one entry found"  # pragma NO COVERAGE
+                )                                          # pragma NO COVERAGE
+            attrs = entry[0][1]
         # read attributes from result and set to self
-        attrs = entry[0][1]
         for key, item in attrs.items():
             if len(item) == 1 and not self.is_multivalued(key):
                 self[key] = item[0]
@@ -188,12 +192,14 @@ class LDAPStorage(OdictStorage):
         self._modified_children = set()
         self._deleted_children = set()
         self._reload = False
+        self._prefetched = None
         self._multivalued_attributes = {}
         self._binary_attributes = {}
         self._page_size = 1000
         if props:
             # only at root node
-            self._ldap_session = LDAPSession(props)
+            # nodes with equal props share connections and cache
+            self._ldap_session = LDAPSession(props, shared=True)
             self._ldap_session.baseDN = self.DN
             self._ldap_schema_info = LDAPSchemaInfo(props)
             self._multivalued_attributes = props.multivalued_attributes
@@ -204,6 +210,8 @@ class LDAPStorage(OdictStorage):
         self.search_filter = None
         self.search_criteria = None
         self.search_relation = None
+        # attributes of children fetched while iterating via items or values
+        self.child_attrlist = None
         # creation related default
         self.child_factory = LDAPNode
         self.child_defaults = None
@@ -216,22 +224,15 @@ class LDAPStorage(OdictStorage):
         try:
             return self.storage[key]
         except KeyError:
-            val = self.child_factory()
-            val.__name__ = key
-            val.__parent__ = self
             try:
                 res = self.ldap_session.search(
                     scope=BASE,
-                    baseDN=val.DN.encode('utf-8'),
+                    baseDN=self.child_dn(key).encode('utf-8'),
                     attrlist=[''],  # no need for attrs
                 )
-                # remember DN
-                val._dn = res[0][0]
-                val._ldap_session = self.ldap_session
-                self.storage[key] = val
-                return val
             except (NO_SUCH_OBJECT, INVALID_DN_SYNTAX):
                 raise KeyError(key)
+            return self._hydrate_child(key, res[0][0])
 
     @finalize
     def __setitem__(self, key, val):
@@ -291,35 +292,41 @@ class LDAPStorage(OdictStorage):
 
     @finalize
     def __iter__(self):
-        if self.name is None:
-            return
-        cookie = ''
-        while True:
-            try:
-                res = self.ldap_session.search(
-                    scope=ONELEVEL,
-                    baseDN=encode(self.DN),
-                    attrlist=[''],
-                    page_size=self._page_size,
-                    cookie=cookie,
-                )
-            except NO_SUCH_OBJECT:
-                # happens if not persisted yet
-                res = list()
-            if isinstance(res, tuple):
-                res, cookie = res
-            for dn, _ in res:
-                key = decode(explode_dn(dn)[0])
-                # do not yield if node is supposed to be deleted
-                if key not in self._deleted_children:
-                    yield key
-            if not cookie:
-                break
-
+        for key, dn, attrs in self._iter_children():
+            yield key
         # also yield keys of children not persisted yet.
         for key in self._added_children:
             yield key
 
+    @finalize
+    def iteritems(self):
+        # children are built from the results of the one level search
+        # instead of searching for each child in ``__getitem__``
+        attrlist = self.child_attrlist
+        if attrlist and '*' not in attrlist:
+            # partial attributes can't be used for loading children attrs
+            raise ValueError(u"child_attrlist must contain '*'.")
+        for key, dn, attrs in self._iter_children(attrlist):
+            child = self.storage.get(key)
+            if child is None:
+                child = self._hydrate_child(key, dn, attrs=attrs)
+            yield key, child
+        for key in self._added_children:
+            yield key, self.storage[key]
+
+    @finalize
+    def itervalues(self):
+        for key, child in self.iteritems():
+            yield child
+
+    @finalize
+    def items(self):
+        return list(self.iteritems())
+
+    @finalize
+    def values(self):
+        return list(self.itervalues())
+
     @finalize
     def __call__(self):
         if self.changed and self._action is not None:
@@ -440,20 +447,40 @@ class LDAPStorage(OdictStorage):
     @default
     def node_by_dn(self, dn, strict=False):
         """Return node from tree by DN.
+
+        Nodes not loaded yet on the path to DN are looked up at once.
         """
         root = node = self.root
         base_dn = root.name
         if not dn.endswith(base_dn):
             raise ValueError(u'Invalid base DN')
         dn = dn[:len(dn) - len(base_dn)].strip(',')
-        for rdn in reversed(explode_dn(encode(dn))):
-            try:
-                node = node[rdn]
-            except KeyError:
+        rdns = [decode(rdn) for rdn in reversed(explode_dn(encode(dn)))]
+        # walk nodes already loaded
+        while rdns and rdns[0] in node.storage:
+            node = node.storage[rdns.pop(0)]
+        if not rdns:
+            return node
+        # query remaining path at once
+        dns = [node.child_dn(rdns[0])]
+        for rdn in rdns[1:]:
+            dns.append(u','.join([rdn, dns[-1]]))
+        queries = [
+            dict(scope=BASE, baseDN=encode(child_dn), attrlist=[''])
+            for child_dn in dns
+        ]
+        results = node.ldap_session.search_many(queries, return_errors=True)
+        for rdn, res in zip(rdns, results):
+            if isinstance(res, Exception) \
+                    and not isinstance(res, (NO_SUCH_OBJECT,
+                                             INVALID_DN_SYNTAX)):
+                raise res
+            if isinstance(res, Exception) or not res:
                 if strict:
                     raise ValueError(u'Tree contains no node by given DN. '
                                      u'Failed at RDN {}'.format(rdn))
                 return None
+            node = node._hydrate_child(rdn, res[0][0])
         return node
 
     @default
@@ -461,7 +488,71 @@ class LDAPStorage(OdictStorage):
     def search(self, queryFilter=None, criteria=None, attrlist=None,
                relation=None, relation_node=None, exact_match=False,
                or_search=False, or_keys=None, or_values=None,
-               page_size=None, cookie=None, get_nodes=False):
+               page_size=None, cookie=None, get_nodes=False, timeout=None):
+        _filter, attrset = self._search_query(
+            queryFilter, criteria, attrlist, relation, relation_node,
+            or_search, or_keys, or_values
+        )
+        # perform the backend search
+        matches = self.ldap_session.search(
+            _filter,
+            self.search_scope,
+            baseDN=encode(self.DN),
+            force_reload=self._reload,
+            attrlist=attrset,
+            page_size=page_size,
+            cookie=cookie,
+            timeout=timeout,
+        )
+        if type(matches) is tuple:
+            matches, cookie = matches
+        # check exact match
+        if exact_match and len(matches) > 1:
+            raise ValueError(u"Exact match asked but result not unique")
+        if exact_match and len(matches) == 0:
+            raise ValueError(u"Exact match asked but result length is zero")
+        # extract key and desired attributes
+        res = [
+            self._search_result_item(dn, attrs, attrlist, get_nodes)
+            for dn, attrs in matches
+        ]
+        if cookie is not None:
+            return (res, cookie)
+        return res
+
+    @default
+    def search_iter(self, queryFilter=None, criteria=None, attrlist=None,
+                    relation=None, relation_node=None, or_search=False,
+                    or_keys=None, or_values=None, page_size=None,
+                    get_nodes=False, timeout=None):
+        """Search generator yielding result items as they arrive from the
+        directory. Result items are the same as returned by ``search``.
+
+        The result set is never buffered as a whole, paging is done
+        internally. ``page_size`` defaults to the configured page size.
+        Cache is not considered. ``timeout`` applies per page request.
+        """
+        if page_size is None:
+            page_size = self.ldap_session._props.page_size
+        _filter, attrset = self._search_query(
+            queryFilter, criteria, attrlist, relation, relation_node,
+            or_search, or_keys, or_values
+        )
+        matches = self.ldap_session.search_iter(
+            _filter,
+            self.search_scope,
+            baseDN=encode(self.DN),
+            attrlist=attrset,
+            page_size=page_size,
+            timeout=timeout,
+        )
+        for dn, attrs in matches:
+            yield self._search_result_item(dn, attrs, attrlist, get_nodes)
+
+    @default
+    def _search_query(self, queryFilter, criteria, attrlist, relation,
+                      relation_node, or_search, or_keys, or_values):
+        # return filter string and LDAP attrlist for search
         attrset = set(attrlist or [])
         attrset.discard('dn')
         attrset.discard('rdn')
@@ -487,61 +578,50 @@ class LDAPStorage(OdictStorage):
                 _filter &= relation
             else:
                 _filter &= LDAPRelationFilter(relation_node, relation)
-        # perform the backend search
-        matches = self.ldap_session.search(
-            str(_filter),
-            self.search_scope,
-            baseDN=encode(self.DN),
-            force_reload=self._reload,
-            attrlist=list(attrset),
-            page_size=page_size,
-            cookie=cookie,
-        )
-        if type(matches) is tuple:
-            matches, cookie = matches
-        # check exact match
-        if exact_match and len(matches) > 1:
-            raise ValueError(u"Exact match asked but result not unique")
-        if exact_match and len(matches) == 0:
-            raise ValueError(u"Exact match asked but result length is zero")
+        return str(_filter), list(attrset)
+
+    @default
+    def _search_result_item(self, dn, attrs, attrlist, get_nodes):
         # extract key and desired attributes
-        res = []
-        for dn, attrs in matches:
-            dn = decode(dn)
-            if attrlist is not None:
-                resattr = dict()
-                for k, v in attrs.iteritems():
-                    if k in attrlist:
-                        # Check binary binary attribute directly from root
-                        # data to avoid initing attrs for a simple search.
-                        if k in self.root._binary_attributes:
-                            resattr[decode(k)] = v
-                        else:
-                            resattr[decode(k)] = decode(v)
-                if 'dn' in attrlist:
-                    resattr[u'dn'] = dn
-                if 'rdn' in attrlist:
-                    rdn = explode_dn(encode(dn))[0]
-                    resattr[u'rdn'] = decode(rdn)
-                if get_nodes:
-                    res.append((self.node_by_dn(dn, strict=True), resattr))
-                else:
-                    res.append((dn, resattr))
-            else:
-                if get_nodes:
-                    res.append(self.node_by_dn(dn, strict=True))
-                else:
-                    res.append(dn)
-        if cookie is not None:
-            return (res, cookie)
-        return res
+        dn = decode(dn)
+        if attrlist is not None:
+            resattr = dict()
+            for k, v in attrs.iteritems():
+                if k in attrlist:
+                    # Check binary binary attribute directly from root
+                    # data to avoid initing attrs for a simple search.
+                    if k in self.root._binary_attributes:
+                        resattr[decode(k)] = v
+                    else:
+                        resattr[decode(k)] = decode(v)
+            if 'dn' in attrlist:
+                resattr[u'dn'] = dn
+            if 'rdn' in attrlist:
+                rdn = explode_dn(encode(dn))[0]
+                resattr[u'rdn'] = decode(rdn)
+            if get_nodes:
+                return (self.node_by_dn(dn, strict=True), resattr)
+            return (dn, resattr)
+        if get_nodes:
+            return self.node_by_dn(dn, strict=True)
+        return dn
 
     @default
     def batched_search(self, page_size=None, search_func=None, **kw):
         """Search generator function which does paging for us.
+
+        If no custom ``search_func`` is given, results are streamed via
+        ``search_iter``.
         """
         if page_size is None:
             page_size = self.ldap_session._props.page_size
+        if search_func is None and 'exact_match' not in kw:
+            try:
+                for item in self.search_iter(page_size=page_size, **kw):
+                    yield item
+            except ValueError:
+                pass
+            return
         if search_func is None:
             search_func = self.search
         matches = []
@@ -565,22 +645,22 @@ class LDAPStorage(OdictStorage):
         If key is None:
             - check if self is changed
             - if changed, raise RuntimeError
+            - evict cached search results of the subtree of self
             - reload self.attrs
-            - set self._reload to True. This reloads the keys forcing cache
-              reload as well.
 
         If key is given:
             - if changed, raise RuntimeError
-            - if not changed, remove item from self.storage.
+            - if not changed, remove item from self.storage and evict cached
+              search results of the subtree of the child.
         """
         if key is None:
             if self.changed:
                 raise RuntimeError(u"Invalid tree state. Try to invalidate "
                                    u"changed node.")
+            if self.ldap_session:
+                self.ldap_session.invalidate(encode(self.DN), subtree=True)
             self.storage.clear()
             self.attrs.load()
-            # XXX: needs to get unset again somwhere
-            self._reload = True
             return
         try:
             child = self.storage[key]
@@ -591,6 +671,53 @@ class LDAPStorage(OdictStorage):
             del self.storage[key]
         except KeyError:
             pass
+        if self.ldap_session:
+            self.ldap_session.invalidate(encode(self.child_dn(key)),
+                                         subtree=True)
+
+    @default
+    def _iter_children(self, attrlist=None):
+        # paged one level search for children. yield key, DN and attributes
+        # of children not supposed to be deleted
+        if self.name is None:
+            return
+        cookie = ''
+        while True:
+            try:
+                res = self.ldap_session.search(
+                    scope=ONELEVEL,
+                    baseDN=encode(self.DN),
+                    attrlist=attrlist or [''],
+                    page_size=self._page_size,
+                    cookie=cookie,
+                )
+            except NO_SUCH_OBJECT:
+                # happens if not persisted yet
+                res = list()
+            if isinstance(res, tuple):
+                res, cookie = res
+            for dn, attrs in res:
+                key = decode(explode_dn(dn)[0])
+                if key not in self._deleted_children:
+                    yield key, dn, attrs
+            if not cookie:
+                break
+
+    @default
+    def _hydrate_child(self, key, dn, attrs=None):
+        # create child node for key which is known to exist in directory
+        # with given DN and remember it in storage. Attributes are used on
+        # first access of child attrs
+        val = self.child_factory()
+        val.__name__ = key
+        val.__parent__ = self
+        # remember DN
+        val._dn = dn
+        val._ldap_session = self.ldap_session
+        if attrs is not None and self.child_attrlist:
+            val._prefetched = attrs
+        self.storage[key] = val
+        return val
 
     @default
     def _create_suitable_node(self, vessel):
@@ -1,14 +1,31 @@
 # -*- coding: utf-8 -*-
 from bda.cache import ICacheManager
 from bda.cache.interfaces import INullCacheProvider
+from collections import deque
+from contextlib import contextmanager
+from node.ext.ldap.cache import CacheIndex
+from node.ext.ldap.cache import MissCache
+from node.ext.ldap.cache import normalize_dn
 from node.ext.ldap.cache import nullcacheProviderFactory
+from node.ext.ldap.cachekey import search_cache_key
 from node.ext.ldap.interfaces import ICacheProviderFactory
+from node.ext.ldap.mirror import LDAPMirror
+from node.ext.ldap.mirror import MirrorSyncListener
+from node.ext.ldap.pool import LDAPConnectionPool
 from node.ext.ldap.properties import LDAPProps
+from node.ext.ldap.properties import MIRROR_DEFAULTS
+from node.ext.ldap.servers import LDAPServers
+from node.ext.ldap.servers import parse_servers
+from node.ext.ldap.sync import LDAPSyncListener
 from zope.component import queryUtility
 
 import hashlib
 import ldap
 import logging
+import select
+import threading
+import time
+import uuid
 
 
 logger = logging.getLogger('node.ext.ldap')
@@ -80,21 +97,131 @@ class LDAPConnector(object):
         self._start_tls = props.start_tls
         self._ignore_cert = props.ignore_cert
         self._tls_cacert_file = props.tls_cacertfile
+        self._pool_min_size = getattr(props, 'pool_min_size', 0)
+        self._pool_max_size = getattr(props, 'pool_max_size', 1)
+        self._pool_idle_timeout = getattr(props, 'pool_idle_timeout', 300.0)
+        self._pool_check_interval = getattr(props, 'pool_check_interval', 60.0)
+        self._auth_pool_size = getattr(props, 'auth_pool_size', 1)
+        self._operation_timeout = getattr(props, 'operation_timeout', None)
+        self._sizelimit = getattr(props, 'sizelimit', 0)
+        self._hedge_percentile = getattr(props, 'hedge_percentile', None)
+        self._hedge_delay = getattr(props, 'hedge_delay', 0.05)
+        self._retry_max = props.retry_max
+        self._servers = LDAPServers(
+            parse_servers(getattr(props, 'uris', None) or [props.uri]),
+            retry_delay=props.retry_delay,
+            probe=self._probe
+        )
+        self._write_servers = None
+        write_uris = getattr(props, 'write_uris', None)
+        if write_uris:
+            self._write_servers = LDAPServers(
+                parse_servers(write_uris),
+                retry_delay=props.retry_delay,
+                probe=self._probe
+            )
+        self._read_your_writes = getattr(props, 'read_your_writes', 0.0)
+        self._sync_base_dns = getattr(props, 'sync_base_dns', None)
+        self._coalesce_searches = getattr(props, 'coalesce_searches', False)
+        self._cache_soft_timeout = getattr(props, 'cache_soft_timeout', 0)
+        self._entry_cache = getattr(props, 'entry_cache', False)
+        self._miss_timeout = getattr(props, 'miss_timeout', 0)
+        self._mirror_file = getattr(props, 'mirror_file', None)
+        self._mirror_base_dns = getattr(props, 'mirror_base_dns', None)
+        self._mirror_attributes = getattr(
+            props, 'mirror_attributes', MIRROR_DEFAULTS
+        )
 
-    def bind(self):
-        """Bind to Server and return the Connection Object.
+    def connect(self, bind=True, uri=None, write=False, factory=None):
+        """Create a new connection, bind to server and return the connection
+        object.
+
+        If multiple servers are configured, a healthy server is selected.
+        Servers not reachable are marked down and the next one is tried.
+
+        bind
+            Flag whether to bind with configured credentials. Unbound
+            connections are used for authentication.
+
+        uri
+            Connect to this server only, without failover.
+
+        write
+            Flag whether to connect to a write server. Only takes effect if
+            dedicated write servers are configured.
+
+        factory
+            Callable accepting the server URI and returning a connection
+            object. Defaults to ``ldap.initialize``.
+        """
+        if uri is not None:
+            try:
+                con = self._initialize(uri, factory=factory)
+                if bind:
+                    con.simple_bind_s(self._bindDN, self._bindPW)
+            except ldap.SERVER_DOWN:
+                self.server_down(con=None, uri=uri)
+                raise
+            return con
+        servers = self._servers
+        if write and self._write_servers is not None:
+            servers = self._write_servers
+        tried = list()
+        while True:
+            server = servers.select(exclude=tried)
+            try:
+                con = self._initialize(server.uri, factory=factory)
+                if bind:
+                    con.simple_bind_s(self._bindDN, self._bindPW)
+            except ldap.SERVER_DOWN:
+                servers.mark_down(server)
+                tried.append(server)
+                if len(tried) == len(servers.servers):
+                    raise
+                continue
+            servers.mark_up(server)
+            return con
+
+    def server_down(self, con, uri=None):
+        """Mark server of given connection object or URI down.
         """
+        if uri is None:
+            uri = getattr(con, '_uri', None)
+        for servers in (self._servers, self._write_servers):
+            if servers is None:
+                continue
+            server = servers.server(uri)
+            if server is not None:
+                servers.mark_down(server)
+
+    def _initialize(self, uri, factory=None):
         if self._ignore_cert:
             ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
         elif self._tls_cacert_file:
             ldap.set_option(ldap.OPT_X_TLS_CACERTFILE, self._tls_cacert_file)
-        self._con = ldap.initialize(self._uri)
-        self._con.protocol_version = self.protocol
+        con = factory(uri) if factory is not None else ldap.initialize(uri)
+        con.protocol_version = self.protocol
         if self._start_tls:
             # ignore in tests for now. nevertheless provide a test environment
             # for TLS and SSL later
-            self._con.start_tls_s()                        # pragma NO COVERAGE
-        self._con.simple_bind_s(self._bindDN, self._bindPW)
+            con.start_tls_s()                              # pragma NO COVERAGE
+        return con
+
+    def _probe(self, uri):
+        # check whether server is reachable by reading root DSE
+        try:
+            con = self._initialize(uri)
+            con.set_option(ldap.OPT_NETWORK_TIMEOUT, self._servers.retry_delay)
+            con.search_ext_s('', ldap.SCOPE_BASE, '(objectClass=*)', ['1.1'])
+            con.unbind_s()
+        except ldap.LDAPError:
+            return False
+        return True
+
+    def bind(self):
+        """Bind to Server and return the Connection Object.
+        """
+        self._con = self.connect()
         return self._con
 
     def unbind(self):
@@ -104,6 +231,243 @@ class LDAPConnector(object):
         self._con = None
 
 
+class LDAPRequest(object):
+    """Pending LDAP operation.
+
+    Created by the ``*_async`` functions of ``LDAPCommunicator``. The result
+    can be polled non-blocking or waited for. ``fileno`` returns the file
+    descriptor of the underlying connection for integration into select based
+    event loops.
+    """
+
+    def __init__(self, con, msgid, release=None, callback=None):
+        """
+        con
+            Connection object the request has been sent on.
+
+        msgid
+            Message id of the request.
+
+        release
+            Callable invoked once the request completed. Gets passed the
+            error as ``error`` keyword argument if the request failed.
+
+        callback
+            Callable invoked with ``rtype``, ``rdata`` and ``rctrls`` once
+            the response arrived. Its return value is the result of the
+            request. Defaults to None as result.
+        """
+        self.msgid = msgid
+        self._con = con
+        self._release = release
+        self._callback = callback
+        self._callbacks = list()
+        self._done = False
+        self._result = None
+        self._error = None
+
+    def fileno(self):
+        """File descriptor of the underlying connection.
+        """
+        return self._con.fileno()
+
+    def add_callback(self, callback=None, errback=None):
+        """Add post-processing of the result.
+
+        callback
+            Callable getting passed the result. Its return value replaces
+            the result.
+
+        errback
+            Callable getting passed the error if request failed. Its return
+            value replaces the result, unless it raises.
+        """
+        self._callbacks.append((callback, errback))
+        if self._done:
+            self._run_callbacks(self._callbacks[-1:])
+        return self
+
+    def done(self):
+        """Check non-blocking whether request completed.
+        """
+        if not self._done:
+            self._fetch(0)
+        return self._done
+
+    poll = done
+
+    def result(self, timeout=None):
+        """Wait for and return the result of the request.
+
+        Raise ``ldap.TIMEOUT`` if timeout in seconds is given and the
+        response did not arrive in time, also if timeout is 0. The request
+        stays pending in this case. Raise the LDAP error if request failed.
+        """
+        if not self._done:
+            self._fetch(-1 if timeout is None else timeout)
+        if not self._done:
+            # polled without response
+            raise ldap.TIMEOUT({'desc': 'Timeout exceeded'})
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def entries(self, timeout=None):
+        """Generator yielding entries of a search request as they arrive.
+
+        The result of the request is available via ``result`` afterwards,
+        without the entries. If the generator gets closed before all entries
+        were received, the request gets abandoned.
+
+        timeout
+            Maximum time in seconds to wait for the next entry. Raise
+            ``ldap.TIMEOUT`` if exceeded.
+        """
+        try:
+            while not self._done:
+                try:
+                    rtype, rdata, _, rctrls = self._con.result3(
+                        self.msgid,
+                        0,
+                        -1 if timeout is None else timeout
+                    )
+                except ldap.TIMEOUT:
+                    raise
+                except ldap.LDAPError, e:
+                    self._finish(error=e)
+                    break
+                if rtype == ldap.RES_SEARCH_ENTRY:
+                    for entry in rdata:
+                        yield entry
+                elif rtype == ldap.RES_SEARCH_RESULT:
+                    result = None
+                    if self._callback is not None:
+                        result = self._callback(rtype, [], rctrls)
+                    self._finish(result=result)
+        finally:
+            if not self._done:
+                self.abandon()
+        if self._error is not None:
+            raise self._error
+
+    def abandon(self):
+        """Abandon pending request.
+        """
+        if self._done:
+            return
+        try:
+            self._con.abandon(self.msgid)
+        except ldap.LDAPError:
+            pass
+        self._finish(error=ldap.TIMEOUT({'desc': 'Request abandoned'}))
+
+    def _fetch(self, timeout):
+        try:
+            rtype, rdata, _, rctrls = self._con.result3(
+                self.msgid,
+                1,
+                timeout
+            )
+        except ldap.TIMEOUT:
+            # request stays pending
+            raise
+        except ldap.LDAPError, e:
+            self._finish(error=e)
+            return
+        if rtype is None:
+            # polled, no response yet
+            return
+        result = None
+        if self._callback is not None:
+            result = self._callback(rtype, rdata, rctrls)
+        self._finish(result=result)
+
+    def _finish(self, result=None, error=None):
+        self._done = True
+        self._result = result
+        self._error = error
+        if self._release is not None:
+            self._release(error=error)
+        self._run_callbacks(self._callbacks)
+
+    def _run_callbacks(self, callbacks):
+        for callback, errback in callbacks:
+            try:
+                if self._error is not None:
+                    if errback is not None:
+                        self._result = errback(self._error)
+                        self._error = None
+                elif callback is not None:
+                    self._result = callback(self._result)
+            except Exception, e:
+                self._error = e
+
+
+# maximum time in seconds to block in ``wait`` before polling again. Needed
+# since responses might get buffered by libldap while another request on a
+# shared connection is processed, without the file descriptor signaling it.
+POLL_INTERVAL = 0.05
+
+
+def wait(requests, timeout=None):
+    """Wait until at least one of given ``LDAPRequest`` instances completed.
+
+    Return the list of completed requests. Return an empty list if timeout in
+    seconds is given and no request completed in time.
+    """
+    requests = list(requests)
+    deadline = timeout is not None and time.time() + timeout or None
+    while True:
+        done = [_ for _ in requests if _.done()]
+        if done or not requests:
+            return done
+        interval = POLL_INTERVAL
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return done
+            interval = min(remaining, interval)
+        fds = set([_.fileno() for _ in requests])
+        select.select(list(fds), [], [], interval)
+
+
+class _SearchFlight(object):
+    # search in progress, shared by concurrent identical searches
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise ldap.TIMEOUT(u"Coalesced search timed out.")
+        if self.error is not None:
+            raise self.error
+        # callers must not share the result list
+        return list(self.result)
+
+
+# number of search latency samples considered for the hedge delay percentile
+HEDGE_SAMPLES = 1000
+
+# minimum number of samples before the percentile is used instead of the
+# configured hedge delay
+HEDGE_MIN_SAMPLES = 20
+
+# maximum number of concurrent background refreshes of stale cached results
+REVALIDATE_MAX = 8
+
+# prefix of paged results cookies generated for pages served from cache
+PAGE_COOKIE_PREFIX = 'node.ext.ldap.page:'
+
+
 class LDAPCommunicator(object):
     """Class LDAPCommunicator is responsible for the communication with the
     LDAP Server.
@@ -119,8 +483,32 @@ class LDAPCommunicator(object):
         """
         self.baseDN = ''
         self._connector = connector
-        self._con = None
+        self._pool = None
+        self._auth_pool = None
+        self._auth_lock = threading.Lock()
+        self._auth_stats = dict(attempts=0, succeeded=0, failed=0)
+        self._write_pool = None
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._hedge_pools = dict()
+        self._hedge_lock = threading.Lock()
+        self._hedge_stats = dict(searches=0, hedged=0, won=0)
+        self._latencies = deque(maxlen=HEDGE_SAMPLES)
         self._cache = None
+        self._cache_index = CacheIndex()
+        self._cache_lock = threading.Lock()
+        self._cache_generation = 0
+        self._sync_listeners = list()
+        self._flights = dict()
+        self._flights_lock = threading.Lock()
+        self._coalesce_stats = dict(searches=0, coalesced=0)
+        self._revalidating = set()
+        self._revalidate_lock = threading.Lock()
+        self._cache_pages = False
+        self._misses = None
+        self._mirror = None
+        if connector._miss_timeout:
+            self._misses = MissCache(connector._miss_timeout)
         if connector._cache:
             cachefactory = queryUtility(ICacheProviderFactory)
             if cachefactory is None:
@@ -128,6 +516,9 @@ class LDAPCommunicator(object):
             cacheprovider = cachefactory()
             self._cache = ICacheManager(cacheprovider)
             self._cache.setTimeout(connector._cachetimeout)
+            # pages are only served locally if results are really cached
+            self._cache_pages = \
+                not INullCacheProvider.providedBy(cacheprovider)
             if not INullCacheProvider.providedBy(self._cache):
                 logger.debug(
                     u"LDAP Caching activated for instance '{0:s}'. "
@@ -145,18 +536,285 @@ class LDAPCommunicator(object):
 
     def bind(self):
         """Bind to LDAP Server.
+
+        Creates the connection pool and checks whether a connection can be
+        established.
         """
-        self._con = self._connector.bind()
+        if self._pool is None:
+            connector = self._connector
+            self._pool = LDAPConnectionPool(
+                connector,
+                min_size=connector._pool_min_size,
+                max_size=connector._pool_max_size,
+                idle_timeout=connector._pool_idle_timeout,
+                check_interval=connector._pool_check_interval
+            )
+        self._pool.checkin(self._pool.checkout())
+        self._pool.fill()
+        if self._cache is not None and self._connector._sync_base_dns \
+                and not self._sync_listeners:
+            for baseDN in self._connector._sync_base_dns:
+                listener = LDAPSyncListener(
+                    self,
+                    baseDN,
+                    retry_delay=self._connector._servers.retry_delay
+                )
+                listener.start()
+                self._sync_listeners.append(listener)
+        connector = self._connector
+        if connector._mirror_file and connector._mirror_base_dns \
+                and self._mirror is None:
+            self._mirror = LDAPMirror(
+                connector._mirror_file,
+                connector._mirror_base_dns,
+                attributes=connector._mirror_attributes
+            )
+            for baseDN in connector._mirror_base_dns:
+                listener = MirrorSyncListener(
+                    self,
+                    self._mirror,
+                    baseDN,
+                    retry_delay=connector._servers.retry_delay
+                )
+                listener.start()
+                self._sync_listeners.append(listener)
 
     def unbind(self):
         """Unbind from LDAP Server.
         """
-        self._connector.unbind()
-        self._con = None
+        if self._pool is not None:
+            self._pool.close()
+        self._pool = None
+        if self._auth_pool is not None:
+            self._auth_pool.close()
+        self._auth_pool = None
+        with self._write_lock:
+            if self._write_pool is not None:
+                self._write_pool.close()
+            self._write_pool = None
+        with self._hedge_lock:
+            for pool in self._hedge_pools.values():
+                pool.close()
+            self._hedge_pools.clear()
+        for listener in self._sync_listeners:
+            listener.stop()
+        self._sync_listeners = list()
+        if self._mirror is not None:
+            self._mirror.close()
+        self._mirror = None
+
+    def _get_pool(self, pool=None):
+        if pool is None:
+            pool = self._pool
+        if pool is None:
+            raise ValueError(u"Communicator not bound.")
+        return pool
+
+    def _get_auth_pool(self):
+        with self._auth_lock:
+            if self._auth_pool is None:
+                connector = self._connector
+                self._auth_pool = LDAPConnectionPool(
+                    connector,
+                    max_size=connector._auth_pool_size,
+                    idle_timeout=connector._pool_idle_timeout,
+                    check_interval=connector._pool_check_interval,
+                    bind=False,
+                    exclusive=True
+                )
+            return self._auth_pool
+
+    def _get_write_pool(self):
+        # pool of connections to write servers. The communicator pool is used
+        # if no dedicated write servers are configured
+        pool = self._get_pool()
+        connector = self._connector
+        if connector._write_servers is None:
+            return pool
+        with self._write_lock:
+            if self._write_pool is None:
+                self._write_pool = LDAPConnectionPool(
+                    connector,
+                    max_size=connector._pool_max_size,
+                    idle_timeout=connector._pool_idle_timeout,
+                    check_interval=connector._pool_check_interval,
+                    write=True
+                )
+            return self._write_pool
+
+    def _get_read_pool(self, cookie=None):
+        # reads go to the write servers within the read your writes window
+        # after a write of the current thread, and if continuing a paged
+        # search issued there
+        write_pool = self._write_pool
+        if write_pool is not None and cookie and write_pool.pinned(cookie):
+            return write_pool
+        if self._recently_written():
+            return self._get_write_pool()
+        return self._get_pool()
+
+    def _recently_written(self):
+        # check whether the current thread wrote within the read your writes
+        # window
+        last_write = getattr(self._local, 'last_write', None)
+        window = self._connector._read_your_writes
+        return last_write is not None and time.time() - last_write < window
+
+    def _submit_write(self, operation, dn):
+        # send write operation to write servers. Cached search results which
+        # might contain the entry get evicted once the write completed
+        self._local.last_write = time.time()
+        request = self._submit(operation, pool=self._get_write_pool())
+
+        def written(result):
+            if self._mirror is not None:
+                self._mirror.mark_dirty(dn)
+            self.invalidate(dn)
+            return result
+
+        return request.add_callback(written)
+
+    def invalidate(self, dn=None, subtree=False):
+        """Evict cached search results which might contain the entry with
+        given DN, i.e. base searches on it, one level searches on its parent
+        and subtree searches on it or its ancestors. Called automatically
+        after writes.
+
+        Only search results cached by this communicator are known. Cached
+        misses are evicted for the whole subtree of DN.
+
+        dn
+            DN of the entry. If None, all known search results get evicted.
+
+        subtree
+            Flag whether to evict all search results based within the
+            subtree of DN as well.
+        """
+        # bumping the generation also prevents joining searches started
+        # before, see ``_search_coalesced``
+        with self._cache_lock:
+            self._cache_generation += 1
+        if self._misses is not None:
+            self._misses.invalidate(dn)
+        if not self._cache:
+            return
+        if dn is None:
+            keys = self._cache_index.keys()
+        else:
+            keys = self._cache_index.affected(dn, subtree=subtree)
+        for key in keys:
+            self._cache.rem(key)
+        self._cache_index.remove(keys)
+
+    def _cache_indexed(self, key, args, generation):
+        # remember search base and scope of cached result. Results fetched
+        # while an invalidation happened might be stale and get evicted
+        if generation != self._cache_generation:
+            self._cache.rem(key)
+            return
+        queryFilter, scope, baseDN = args[:3]
+        for dropped in self._cache_index.add(key, baseDN, scope):
+            self._cache.rem(dropped)
+
+    def _get_hedge_pool(self, uri):
+        # pool of connections to given server used for hedged searches
+        with self._hedge_lock:
+            pool = self._hedge_pools.get(uri)
+            if pool is None:
+                connector = self._connector
+                pool = self._hedge_pools[uri] = LDAPConnectionPool(
+                    connector,
+                    max_size=connector._pool_max_size,
+                    idle_timeout=connector._pool_idle_timeout,
+                    check_interval=connector._pool_check_interval,
+                    uri=uri
+                )
+            return pool
+
+    def _checkin(self, pool, con, error=None):
+        # return connection to pool. Marks the server down and discards the
+        # connection if server is not reachable
+        if isinstance(error, ldap.SERVER_DOWN):
+            self._connector.server_down(con)
+            pool.checkin(con, discard=True)
+            pool.purge(getattr(con, '_uri', None))
+            return
+        # bind requests can not be abandoned, the bind state of the
+        # connection is unknown
+        if isinstance(error, ldap.TIMEOUT) and pool is self._auth_pool:
+            pool.checkin(con, discard=True)
+            return
+        pool.checkin(con)
+
+    @contextmanager
+    def _connection(self, cookie=None, pool=None):
+        # context manager providing a pooled connection
+        pool = self._get_pool(pool)
+        con = pool.checkout(cookie=cookie)
+        try:
+            yield con
+        except Exception, e:
+            self._checkin(pool, con, error=e)
+            raise
+        self._checkin(pool, con)
+
+    def _submit(self, operation, pool=None, cookie=None, callback=None,
+                block=True):
+        # checkout connection and call operation with it, which is expected
+        # to return the message id. The connection is checked in after
+        # the request completed
+        pool = self._get_pool(pool)
+        con = pool.checkout(cookie=cookie, block=block)
+        try:
+            msgid = operation(con)
+        except Exception, e:
+            self._checkin(pool, con, error=e)
+            raise
+        return LDAPRequest(
+            con,
+            msgid,
+            release=lambda error=None: self._checkin(pool, con, error=error),
+            callback=callback
+        )
+
+    def _result(self, request, timeout=None):
+        # wait for result of request. If no timeout given, the configured
+        # operation timeout applies. Expired requests get abandoned
+        if timeout is None:
+            timeout = self._connector._operation_timeout
+        try:
+            return request.result(timeout=timeout)
+        except ldap.TIMEOUT:
+            request.abandon()
+            raise
+
+    def _retry(self, func, *args):
+        # call func and retry up to ``retry_max`` times on a new connection
+        # if server is not reachable. Only use for idempotent operations.
+        retries = self._connector._retry_max
+        while True:
+            try:
+                return func(*args)
+            except ldap.SERVER_DOWN:
+                if retries <= 0:
+                    raise
+                retries -= 1
+                logger.warning(u"LDAP server down. Retry operation.")
+
+    def _paging_controls(self, page_size, cookie):
+        if page_size:
+            if cookie is None:
+                cookie = ''
+            pagedresults = ldap.controls.libldap.SimplePagedResultsControl(
+                criticality=True, size=page_size, cookie=cookie)
+            return [pagedresults]
+        if cookie:
+            raise ValueError('cookie passed without page_size')
+        return []
 
     def search(self, queryFilter, scope, baseDN=None,
                force_reload=False, attrlist=None, attrsonly=0,
-               page_size=None, cookie=None):
+               page_size=None, cookie=None, timeout=None, sizelimit=None):
         """Search the directory.
 
         queryFilter
@@ -169,7 +827,8 @@ class LDAPCommunicator(object):
             Search base. Defaults to ``self.baseDN``
 
         force_reload
-            Force reload of result if cache enabled.
+            Force reload of result if cache enabled. Also bypasses the mirror,
+            see ``mirror_file`` of the props.
 
         attrlist
             LDAP attrlist to query.
@@ -179,73 +838,736 @@ class LDAPCommunicator(object):
             values.
 
         page_size
-            Number of items per page, when doing pagination.
+            Number of items per page, when doing pagination. If results are
+            cached, the complete result is fetched on the first page and
+            held in memory and cache, pages are sliced from it. Use
+            ``search_iter`` for scans of large results without caching.
 
         cookie
             Cookie string returned by previous search with pagination.
+            ``ValueError`` is raised if the cached result a cookie refers to
+            got evicted or replaced meanwhile, e.g. after writes within the
+            search base. The search must be restarted then.
+
+        timeout
+            Time span in seconds the search may take. The request gets
+            abandoned and ``ldap.TIMEOUT`` is raised if exceeded. Also sent
+            to the server as time limit. Defaults to ``operation_timeout``
+            of the props.
+
+        sizelimit
+            Maximum number of entries to return. ``ldap.SIZELIMIT_EXCEEDED``
+            is raised if exceeded. Defaults to ``sizelimit`` of the props.
+        """
+        args = self._search_args(queryFilter, scope, baseDN, attrlist,
+                                 attrsonly, page_size, cookie)
+        mirror = self._mirror
+        if mirror is not None and not force_reload:
+            res = mirror.search(
+                *args,
+                sizelimit=sizelimit or self._connector._sizelimit
+            )
+            if res is not None:
+                return res
+
+        def _search(*args):
+            # no hedging while reading from write servers, hedges are sent
+            # to read servers which might not have the writes yet
+            if self._connector._hedge_percentile is not None \
+                    and not page_size \
+                    and not (self._connector._write_servers is not None
+                             and self._recently_written()):
+                return self._search_hedged(args, timeout, sizelimit)
+            request = self.search_async(*args, timeout=timeout,
+                                        sizelimit=sizelimit)
+            return self._result(request, timeout)
+
+        def _search_retry(*args):
+            # paged searches can only be retried on the first page, cookies
+            # are bound to the connection
+            if cookie:
+                return _search(*args)
+            return self._retry(_search, *args)
+
+        def _search_shared(*args):
+            if page_size:
+                return _search_retry(*args)
+            if not self._connector._coalesce_searches:
+                with self._flights_lock:
+                    self._coalesce_stats['searches'] += 1
+                return _search_retry(*args)
+            return self._search_coalesced(_search_retry, args, timeout,
+                                          sizelimit)
+
+        def _search_cached():
+            if self._cache_pages and page_size \
+                    and not self._server_cookie(cookie):
+                return self._search_paged(_search, args, force_reload,
+                                          sizelimit)
+            if self._cache:
+                key = self._cache_key(*args)
+                if sizelimit:
+                    # cached results might exceed the size limit
+                    key = md5digest('{0}-{1}'.format(key, sizelimit))
+                generation = self._cache_generation
+                if self._entry_cacheable(args):
+                    res = self._search_entries(_search_shared, key, args,
+                                               force_reload, timeout)
+                elif self._connector._cache_soft_timeout:
+                    res = self._search_stale(_search_shared, key, args,
+                                             force_reload)
+                else:
+                    res = self._cache.getData(
+                        _search_shared,
+                        key,
+                        force_reload,
+                        args
+                    )
+                self._cache_indexed(key, args, generation)
+                return res
+            return _search_shared(*args)
+
+        if self._misses is None or page_size:
+            return _search_cached()
+        return self._search_misses(_search_cached, args, force_reload)
+
+    def _server_cookie(self, cookie):
+        # check whether cookie is a paged results cookie of the server
+        return bool(cookie) and not cookie.startswith(PAGE_COOKIE_PREFIX)
+
+    def _search_paged(self, search, args, force_reload, sizelimit=None):
+        # paged search served from cache. The complete result is fetched and
+        # cached once, pages are sliced locally. Cookies are generated by the
+        # client and refer to the offset of the next page within the cached
+        # result identified by token
+        queryFilter, scope, baseDN, attrlist, attrsonly, page_size, cookie = \
+            args
+        key = md5digest('{0}-paged-{1}'.format(
+            self._cache_key(queryFilter, scope, baseDN, attrlist, attrsonly,
+                            None, None),
+            sizelimit or 0
+        ))
+        if cookie:
+            try:
+                offset, token, cookie_key = \
+                    cookie[len(PAGE_COOKIE_PREFIX):].split(':', 2)
+                offset = int(offset)
+            except ValueError:
+                raise ValueError(u"Invalid cookie.")
+            if cookie_key != key:
+                raise ValueError(u"Cookie does not match query.")
+            # never reload or revalidate while paging, pages would get
+            # inconsistent. If the result was evicted or replaced meanwhile,
+            # the search must be restarted
+            record = self._cache_get(key)
+            if record is None or record[0] != token:
+                raise ValueError(u"Paged result expired, restart search.")
+            res = record[1]
+        else:
+            offset = 0
+
+            def fetch(*args):
+                # fetch complete result page by page. Only first page request
+                # can be retried, cookies are bound to the connection
+                args = list(args)
+                args[-1] = ''
+                res = list()
+                page = self._retry(search, *args)
+                while True:
+                    page_cookie = ''
+                    if isinstance(page, tuple):
+                        page, page_cookie = page
+                    res.extend(page)
+                    if not page_cookie:
+                        return uuid.uuid4().hex, res
+                    args[-1] = page_cookie
+                    page = search(*args)
+
+            generation = self._cache_generation
+            token, res = self._search_stale(fetch, key, args, force_reload)
+            self._cache_indexed(key, args, generation)
+        end = offset + page_size
+        if end >= len(res):
+            return res[offset:end], ''
+        return res[offset:end], '{0}{1}:{2}:{3}'.format(
+            PAGE_COOKIE_PREFIX, end, token, key
+        )
+
+    def _search_stale(self, search, key, args, force_reload):
+        # stale while revalidate mode. Stale results are returned while
+        # refreshed in background, callers only block if nothing is cached
+        res = None
+        if not force_reload:
+            res = self._cache_get(key, args, search)
+        if res is None:
+            res = search(*args)
+            self._cache_set(key, res)
+        return res
+
+    def prime(self, queryFilter, scope, baseDN, res, attrlist=None,
+              attrsonly=0):
+        """Store search result in cache as if returned by ``search`` with
+        given arguments. Used to warm up the cache from bulk searches.
+
+        ``res`` must contain only the attributes requested by ``attrlist``.
+        Return whether the result got cached.
+        """
+        if not self._cache:
+            return False
+        args = self._search_args(queryFilter, scope, baseDN, attrlist,
+                                 attrsonly)
+        key = self._cache_key(*args)
+        generation = self._cache_generation
+        self._cache_result(key, args, res)
+        self._cache_indexed(key, args, generation)
+        return True
+
+    def _cache_result(self, key, args, res):
+        # store search result in the record format of the query
+        if self._entry_cacheable(args):
+            self._cache_entries(res, args[3])
+            res = [dn for dn, _ in res]
+        self._cache_set(key, res)
+
+    def _entry_cacheable(self, args):
+        # check whether search result can be resolved from entry cache
+        if not self._connector._entry_cache:
+            return False
+        queryFilter, scope, baseDN, attrlist, attrsonly, page_size = args[:6]
+        if attrsonly or page_size:
+            return False
+        for name in attrlist or []:
+            # operational attributes are not cached
+            if name == '+' or name.startswith('@'):
+                return False
+        return True
+
+    def _entry_key(self, dn):
+        return md5digest('entry\x00{0}\x00{1}'.format(
+            self._connector._bindDN, normalize_dn(dn)
+        ))
+
+    def _search_entries(self, search, key, args, force_reload, timeout=None):
+        # entry cache mode. The DN list of the result is cached for the
+        # query, and the attributes per entry
+        attrlist = args[3]
+        fetched = list()
+
+        def fetch(*args):
+            res = search(*args)
+            self._cache_entries(res, attrlist)
+            fetched.append(res)
+            return [dn for dn, _ in res]
+
+        dns = self._search_stale(fetch, key, args, force_reload)
+        if fetched:
+            return fetched[-1]
+        return self._resolve_entries(dns, attrlist, timeout)
+
+    def _cache_entries(self, res, attrlist):
+        # store entries of search result in entry cache. Entries fetched with
+        # different attribute lists get merged
+        complete = not attrlist or '*' in attrlist
+        names = None
+        if not complete:
+            names = frozenset([_.lower() for _ in attrlist])
+        if names == frozenset(['']) or names == frozenset(['1.1']):
+            return
+        generation = self._cache_generation
+        for dn, attrs in res:
+            entry_key = self._entry_key(dn)
+            entry_names = names
+            if not complete:
+                cached = self._cache.get(entry_key)
+                if cached is not None:
+                    cached_attrs, cached_names = cached
+                    merged = dict(cached_attrs)
+                    merged.update(attrs)
+                    attrs = merged
+                    if cached_names is None:
+                        entry_names = None
+                    else:
+                        entry_names = cached_names | names
+            self._cache.set(entry_key, (attrs, entry_names))
+            self._cache_indexed(entry_key, [None, ldap.SCOPE_BASE, dn],
+                                generation)
+
+    def _entry_attrs(self, entry, attrlist):
+        # return attributes of cached entry requested by attrlist, or None if
+        # cached entry does not contain all requested attributes
+        if entry is None:
+            return None
+        attrs, names = entry
+        if not attrlist or '*' in attrlist:
+            if names is not None:
+                return None
+            return dict(attrs)
+        requested = set([_.lower() for _ in attrlist])
+        if names is not None and not requested.issubset(names):
+            return None
+        return dict([(name, values) for name, values in attrs.items()
+                     if name.lower() in requested])
+
+    def _resolve_entries(self, dns, attrlist, timeout=None):
+        # resolve DN list from entry cache. Missing entries are fetched at
+        # once by sending base searches without waiting for each response
+        if attrlist and set(attrlist).issubset(set(['', '1.1'])):
+            return [(dn, dict()) for dn in dns]
+        res = list()
+        missing = list()
+        for dn in dns:
+            attrs = self._entry_attrs(self._cache.get(self._entry_key(dn)),
+                                      attrlist)
+            if attrs is None:
+                missing.append((len(res), dn))
+            res.append((dn, attrs))
+        requests = [
+            (index, self.search_async('(objectClass=*)', ldap.SCOPE_BASE,
+                                      dn, attrlist))
+            for index, dn in missing
+        ]
+        gone = set()
+        for index, request in requests:
+            try:
+                entry = self._result(request, timeout)
+            except ldap.NO_SUCH_OBJECT:
+                # deleted meanwhile
+                gone.add(index)
+                continue
+            self._cache_entries(entry, attrlist)
+            res[index] = entry[0]
+        return [entry for index, entry in enumerate(res)
+                if index not in gone]
+
+    def _cache_get(self, key, args=None, search=None):
+        # return cached search result or None. Cached results are stored with
+        # time of storage in stale while revalidate mode. Stale results get
+        # refreshed in background if search function is given
+        record = self._cache.get(key)
+        soft_timeout = self._connector._cache_soft_timeout
+        if not soft_timeout or record is None:
+            return record
+        if not isinstance(record, tuple) or len(record) != 2 \
+                or not isinstance(record[0], float):
+            # stored without time of storage
+            return None
+        stored, res = record
+        if search is not None and time.time() - stored >= soft_timeout:
+            self._revalidate(key, args, search)
+        return res
+
+    def _cache_set(self, key, res):
+        if self._connector._cache_soft_timeout:
+            res = (time.time(), res)
+        self._cache.set(key, res)
+
+    def _revalidate(self, key, args, search):
+        # refresh cached search result in a background thread. Only one
+        # refresh per key runs at a time
+        with self._revalidate_lock:
+            if key in self._revalidating \
+                    or len(self._revalidating) >= REVALIDATE_MAX:
+                return
+            self._revalidating.add(key)
+        generation = self._cache_generation
+
+        def refresh():
+            try:
+                self._cache_set(key, search(*args))
+                self._cache_indexed(key, args, generation)
+            except Exception, e:
+                logger.warning(
+                    u"Refreshing cached search result failed: {0}".format(e)
+                )
+            finally:
+                with self._revalidate_lock:
+                    self._revalidating.discard(key)
+
+        thread = threading.Thread(target=refresh)
+        thread.daemon = True
+        thread.start()
+
+    def _search_coalesced(self, search, args, timeout=None, sizelimit=None):
+        # concurrent identical searches share one request to the server.
+        # Searches started before a write never get joined after it
+        key = self._cache_key(*args)
+        if sizelimit:
+            key = md5digest('{0}-{1}'.format(key, sizelimit))
+        generation = self._cache_generation
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.generation == generation:
+                self._coalesce_stats['coalesced'] += 1
+                leader = False
+            else:
+                flight = self._flights[key] = _SearchFlight(generation)
+                self._coalesce_stats['searches'] += 1
+                leader = True
+        if not leader:
+            if timeout is None:
+                timeout = self._connector._operation_timeout
+            return flight.wait(timeout)
+        try:
+            res = search(*args)
+        except BaseException, e:
+            flight.finish(error=e)
+            raise
+        else:
+            flight.finish(result=res)
+        finally:
+            with self._flights_lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+        return res
+
+    @property
+    def coalesce_stats(self):
+        """Dict containing search coalescing metrics. ``searches`` is the
+        number of non paged searches sent to the server, also if coalescing
+        is disabled, and ``coalesced`` the number of searches which joined an
+        identical search in progress.
+        """
+        with self._flights_lock:
+            return dict(self._coalesce_stats)
+
+    def _search_misses(self, search, args, force_reload):
+        # avoid repeated round trips for searches on missing entries
+        key = self._cache_key(*args)
+        if not force_reload:
+            miss = self._misses.get(key)
+            if isinstance(miss, Exception):
+                raise miss
+            if miss is not None:
+                return miss
+        generation = self._cache_generation
+        try:
+            res = search()
+        except ldap.NO_SUCH_OBJECT, e:
+            self._miss(key, args, generation, e)
+            raise
+        if not res:
+            self._miss(key, args, generation, res)
+        return res
+
+    def _miss(self, key, args, generation, miss):
+        # misses fetched while an invalidation happened might be stale
+        if generation != self._cache_generation:
+            return
+        queryFilter, scope, baseDN = args[:3]
+        self._misses.add(key, baseDN, scope, miss)
+
+    def _search_hedged(self, args, timeout=None, sizelimit=None):
+        # send the search to a second server if the first one did not answer
+        # within the hedge delay. The first successful answer wins, the other
+        # request gets abandoned. Errors are only raised if all requests
+        # failed
+        if timeout is None:
+            timeout = self._connector._operation_timeout
+        start = time.time()
+        request = self.search_async(*args, timeout=timeout,
+                                    sizelimit=sizelimit)
+        delay = self._hedge_delay_value()
+        if timeout is not None:
+            delay = min(delay, timeout)
+        requests = [request]
+        if not wait(requests, timeout=delay):
+            hedge = self._send_hedge(request, args, timeout, sizelimit)
+            if hedge is not None:
+                requests.append(hedge)
+            request = self._hedge_winner(requests, start, timeout)
+            with self._hedge_lock:
+                if request is hedge:
+                    self._hedge_stats['won'] += 1
+            for other in requests:
+                if other is not request:
+                    other.abandon()
+        if timeout is not None:
+            timeout = timeout - (time.time() - start)
+            if timeout <= 0 and not request.done():
+                # time is up, no request answered
+                request.abandon()
+                raise ldap.TIMEOUT({'desc': 'Timeout exceeded'})
+            timeout = max(timeout, 0)
+        res = self._result(request, timeout)
+        with self._hedge_lock:
+            self._hedge_stats['searches'] += 1
+            self._latencies.append(time.time() - start)
+        return res
+
+    def _hedge_winner(self, requests, start, timeout):
+        # wait for first request completing successfully. If all requests
+        # failed, the last failed one is returned. If time is up, a pending
+        # request is returned
+        pending = list(requests)
+        failed = None
+        while pending:
+            remaining = None
+            if timeout is not None:
+                remaining = max(timeout - (time.time() - start), 0)
+            done = wait(pending, timeout=remaining)
+            if not done:
+                break
+            for request in done:
+                if request._error is None:
+                    return request
+                pending.remove(request)
+                failed = request
+        if pending:
+            return pending[0]
+        return failed
+
+    def _send_hedge(self, request, args, timeout, sizelimit):
+        # send search to healthy server other than the one of given request.
+        # Return None if no such server is available
+        servers = self._connector._servers
+        primary = servers.server(getattr(request._con, '_uri', None))
+        server = servers.select(exclude=[primary])
+        if server is None or not server.healthy:
+            return None
+        try:
+            hedge = self.search_async(
+                *args,
+                timeout=timeout,
+                sizelimit=sizelimit,
+                pool=self._get_hedge_pool(server.uri)
+            )
+        except ldap.LDAPError:
+            return None
+        with self._hedge_lock:
+            self._hedge_stats['hedged'] += 1
+        return hedge
+
+    def _hedge_delay_value(self):
+        # configured percentile of observed search latencies, at least the
+        # configured hedge delay
+        connector = self._connector
+        with self._hedge_lock:
+            samples = sorted(self._latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return connector._hedge_delay
+        index = int(len(samples) * connector._hedge_percentile / 100.0)
+        return max(samples[min(index, len(samples) - 1)],
+                   connector._hedge_delay)
+
+    @property
+    def hedge_stats(self):
+        """Dict containing hedged search metrics. ``searches`` is the number
+        of searches performed in hedging mode, ``hedged`` the number of
+        searches sent to a second server and ``won`` the number of hedged
+        requests answered first.
+        """
+        with self._hedge_lock:
+            stats = dict(self._hedge_stats)
+        stats['delay'] = self._hedge_delay_value()
+        return stats
+
+    def search_iter(self, queryFilter, scope, baseDN=None, attrlist=None,
+                    attrsonly=0, page_size=None, timeout=None, sizelimit=None):
+        """Generator yielding search result entries as they arrive.
+
+        In contrast to ``search``, the result set is never buffered as a
+        whole. If ``page_size`` is given, the paged results cookie is handled
+        internally. Cache is not considered.
+
+        See ``search`` for arguments. ``timeout`` applies per page request.
+        """
+        args = self._search_args(queryFilter, scope, baseDN, attrlist,
+                                 attrsonly, page_size, None)
+        if timeout is None:
+            timeout = self._connector._operation_timeout
+        retries = self._connector._retry_max
+        cookie = None
+        while True:
+            args[-1] = cookie
+            request = self.search_async(*args, timeout=timeout,
+                                        sizelimit=sizelimit)
+            received = False
+            try:
+                for entry in request.entries(timeout=timeout):
+                    received = True
+                    yield entry
+            except ldap.SERVER_DOWN:
+                # retry only if nothing was delivered yet, cookies are
+                # bound to the connection
+                if cookie or received or retries <= 0:
+                    raise
+                retries -= 1
+                logger.warning(u"LDAP server down. Retry operation.")
+                continue
+            res = request.result()
+            cookie = isinstance(res, tuple) and res[1] or None
+            if not cookie:
+                break
+
+    def search_many(self, queries, force_reload=False, return_errors=False):
+        """Search the directory with multiple queries at once.
+
+        All requests are sent before waiting for the first response, thus
+        independent lookups cost about one round trip instead of one per
+        query. Cached results are considered.
+
+        queries
+            List of dicts containing keyword arguments as accepted by
+            ``search``, except ``force_reload``.
+
+        force_reload
+            Force reload of results if cache enabled.
+
+        return_errors
+            If True, the LDAP error of failed queries is returned in place of
+            the result. Otherwise the first error gets raised after all
+            requests completed.
+
+        Return list of results in order of queries.
         """
+        results = [None] * len(queries)
+        pending = list()
+        generation = self._cache_generation
+
+        def refresh(*args):
+            # stale while revalidate refresh, returns record of query
+            res = self._result(self.search_async(*args))
+            if self._entry_cacheable(args):
+                self._cache_entries(res, args[3])
+                return [dn for dn, _ in res]
+            return res
+
+        for index, query in enumerate(queries):
+            args = self._search_args(**query)
+            key = None
+            if self._cache:
+                key = self._cache_key(*args)
+                if not force_reload:
+                    cached = self._cache_get(key, args, refresh)
+                    if cached is not None and self._entry_cacheable(args):
+                        # DN list of entry cache mode
+                        try:
+                            cached = self._resolve_entries(cached, args[3])
+                        except ldap.LDAPError, e:
+                            cached = e
+                    if cached is not None:
+                        results[index] = cached
+                        continue
+            try:
+                request = self.search_async(*args)
+            except ldap.LDAPError, e:
+                results[index] = e
+                continue
+            pending.append((index, key, args, request))
+
+        def collect(request, args):
+            try:
+                return self._result(request)
+            except ldap.SERVER_DOWN:
+                # cookies are bound to the connection
+                if args[-1]:
+                    raise
+                return self._retry(
+                    lambda: self._result(self.search_async(*args))
+                )
+
+        for index, key, args, request in pending:
+            try:
+                res = collect(request, args)
+            except ldap.LDAPError, e:
+                results[index] = e
+                continue
+            if key is not None:
+                self._cache_result(key, args, res)
+                self._cache_indexed(key, args, generation)
+            results[index] = res
+        if not return_errors:
+            for res in results:
+                if isinstance(res, ldap.LDAPError):
+                    raise res
+        return results
+
+    def _search_args(self, queryFilter, scope, baseDN=None, attrlist=None,
+                     attrsonly=0, page_size=None, cookie=None):
+        # positional search arguments with defaults applied
         if baseDN is None:
             baseDN = self.baseDN
             if not baseDN:
                 raise ValueError(u"baseDN unset.")
+        self._paging_controls(page_size, cookie)
+        return [queryFilter, scope, baseDN, attrlist, attrsonly,
+                page_size, cookie]
 
-        if page_size:
-            if cookie is None:
-                cookie = ''
-            pagedresults = ldap.controls.libldap.SimplePagedResultsControl(
-                criticality=True, size=page_size, cookie=cookie)
-            serverctrls = [pagedresults]
-        else:
-            if cookie:
-                raise ValueError('cookie passed without page_size')
-            serverctrls = []
+    def _cache_key(self, queryFilter, scope, baseDN, attrlist, attrsonly,
+                   page_size, cookie):
+        key = search_cache_key(self._connector._bindDN, queryFilter, scope,
+                               baseDN, attrlist, attrsonly, page_size, cookie)
+        # the format of cached records is part of the key, thus DN lists of
+        # entry cache mode, records with time of storage of stale while
+        # revalidate mode and plain results never get mixed up, e.g. if a
+        # cache is shared by differently configured processes
+        args = [queryFilter, scope, baseDN, attrlist, attrsonly, page_size,
+                cookie]
+        tags = list()
+        if self._entry_cacheable(args):
+            tags.append('entries')
+        if self._connector._cache_soft_timeout:
+            tags.append('stale')
+        if not tags:
+            return key
+        return md5digest('{0}-{1}'.format(key, '-'.join(tags)))
 
-        def _search(baseDN, scope, queryFilter,
-                    attrlist, attrsonly, serverctrls):
-            # we have to do async search to also retrieve server controls
-            # in case we do pagination of results
-            if type(attrlist) in (list, tuple):
-                attrlist = [str(_) for _ in attrlist]
+    def search_async(self, queryFilter, scope, baseDN=None, attrlist=None,
+                     attrsonly=0, page_size=None, cookie=None, timeout=None,
+                     sizelimit=None, pool=None):
+        """Send search request to the directory without waiting for the
+        result. Cache is not considered.
 
-            msgid = self._con.search_ext(
+        See ``search`` for arguments. ``timeout`` and ``sizelimit`` are only
+        sent to the server, the request is not abandoned by the client.
+        ``pool`` is the connection pool to use, defaults to the communicator
+        pool. Return ``LDAPRequest`` instance.
+        """
+        if timeout is None:
+            timeout = self._connector._operation_timeout
+        if sizelimit is None:
+            sizelimit = self._connector._sizelimit
+        if baseDN is None:
+            baseDN = self.baseDN
+            if not baseDN:
+                raise ValueError(u"baseDN unset.")
+        serverctrls = self._paging_controls(page_size, cookie)
+        if type(attrlist) in (list, tuple):
+            attrlist = [str(_) for _ in attrlist]
+        if pool is None:
+            pool = self._get_read_pool(cookie)
+        connections = list()
+
+        def operation(con):
+            # paged searches must continue on the connection the cookie has
+            # been issued on
+            connections.append(con)
+            if cookie:
+                pool.unpin(cookie)
+            return con.search_ext(
                 baseDN,
                 scope,
                 queryFilter,
                 attrlist,
                 attrsonly,
-                serverctrls=serverctrls
+                serverctrls=serverctrls,
+                timeout=-1 if timeout is None else timeout,
+                sizelimit=sizelimit
             )
-            rtype, results, rmsgid, rctrls = self._con.result3(msgid)
+
+        def callback(rtype, results, rctrls):
             ctype = ldap.controls.libldap.SimplePagedResultsControl.controlType
             pctrls = [c for c in rctrls if c.controlType == ctype]
             if pctrls:
+                if pctrls[0].cookie:
+                    pool.pin(pctrls[0].cookie, connections[0])
                 return results, pctrls[0].cookie
-            else:
-                return results
+            return results
 
-        args = [baseDN, scope, queryFilter, attrlist, attrsonly, serverctrls]
-        if self._cache:
-            key_items = [
-                self._connector._bindDN,
-                baseDN,
-                sorted(attrlist or []),
-                attrsonly,
-                queryFilter,
-                scope,
-                page_size,
-                cookie
-            ]
-            key = '-'.join([str(_) for _ in key_items])
-            key = md5digest(key)
-            return self._cache.getData(
-                _search,
-                key,
-                force_reload,
-                args
-            )
-        return _search(*args)
+        return self._submit(operation, pool=pool, cookie=cookie,
+                            callback=callback)
 
-    def add(self, dn, data):
+    def add(self, dn, data, timeout=None):
         """Insert an entry into directory.
 
         dn
@@ -253,11 +1575,23 @@ class LDAPCommunicator(object):
 
         data
             dict containing key/value pairs of entry attributes
+
+        timeout
+            Time span in seconds the operation may take, see ``search``.
+        """
+        self._result(self.add_async(dn, data), timeout)
+
+    def add_async(self, dn, data):
+        """Send add request without waiting for the result. Return
+        ``LDAPRequest`` instance.
         """
         attributes = [(k, v) for k, v in data.items()]
-        self._con.add_s(dn, attributes)
+        return self._submit_write(
+            lambda con: con.add_ext(dn, attributes),
+            dn
+        )
 
-    def modify(self, dn, modlist):
+    def modify(self, dn, modlist, timeout=None):
         """Modify an existing entry in the directory.
 
         Takes the DN of the entry and the modlist, which is a list of tuples
@@ -265,18 +1599,107 @@ class LDAPCommunicator(object):
         of the modification (MOD_REPLACE, MOD_DELETE, or MOD_ADD), the second
         gives the name of the field to modify, and the third gives the new
         value for the field (for MOD_ADD and MOD_REPLACE).
+
+        ``timeout`` is the time span in seconds the operation may take, see
+        ``search``.
+        """
+        self._result(self.modify_async(dn, modlist), timeout)
+
+    def modify_async(self, dn, modlist):
+        """Send modify request without waiting for the result. Return
+        ``LDAPRequest`` instance.
         """
-        self._con.modify_s(dn, modlist)
+        return self._submit_write(
+            lambda con: con.modify_ext(dn, modlist),
+            dn
+        )
 
-    def delete(self, deleteDN):
+    def delete(self, deleteDN, timeout=None):
         """Delete an entry from the directory.
 
-        Take the DN to delete from the directory as argument.
+        Take the DN to delete from the directory as argument. ``timeout`` is
+        the time span in seconds the operation may take, see ``search``.
+        """
+        self._result(self.delete_async(deleteDN), timeout)
+
+    def delete_async(self, deleteDN):
+        """Send delete request without waiting for the result. Return
+        ``LDAPRequest`` instance.
+        """
+        return self._submit_write(
+            lambda con: con.delete_ext(deleteDN),
+            deleteDN
+        )
+
+    def passwd(self, userdn, oldpw, newpw, timeout=None):
+        self._result(self.passwd_async(userdn, oldpw, newpw), timeout)
+
+    def passwd_async(self, userdn, oldpw, newpw):
+        """Send password modify request without waiting for the result.
+        Return ``LDAPRequest`` instance.
         """
-        self._con.delete_s(deleteDN)
+        return self._submit_write(
+            lambda con: con.passwd(userdn, oldpw, newpw),
+            userdn
+        )
+
+    def authenticate(self, dn, pw, timeout=None):
+        """Verify credentials by binding as given DN.
+
+        Uses a dedicated pool of connections which get rebound on every
+        credential check. The communicator connection pool is not touched.
+
+        Raise ``ldap.INVALID_CREDENTIALS`` or ``ldap.UNWILLING_TO_PERFORM`` if
+        bind fails. Raise ``ldap.TIMEOUT`` if bind takes longer than
+        ``timeout`` seconds, see ``search``.
+        """
+        self._retry(
+            lambda: self._result(self._authenticate(dn, pw), timeout)
+        )
+
+    def authenticate_async(self, dn, pw):
+        """Send bind request for verifying credentials without waiting for
+        the result. Return ``LDAPRequest`` instance.
 
-    def passwd(self, userdn, oldpw, newpw):
-        self._con.passwd_s(userdn, oldpw, newpw)
+        Each pending request occupies an authentication connection until its
+        result is fetched. Raise ``node.ext.ldap.pool.PoolExhausted`` if all
+        of them are in use, waiting would never return if the pending
+        requests are the ones of the calling thread. See ``auth_pool_size``
+        of the props.
+        """
+        return self._authenticate(dn, pw, block=False)
+
+    def _authenticate(self, dn, pw, block=True):
+        with self._auth_lock:
+            self._auth_stats['attempts'] += 1
+        request = self._submit(
+            lambda con: con.simple_bind(dn, pw),
+            pool=self._get_auth_pool(),
+            block=block
+        )
+        request.add_callback(self._auth_succeeded, self._auth_failed)
+        return request
+
+    def _auth_succeeded(self, result):
+        with self._auth_lock:
+            self._auth_stats['succeeded'] += 1
+        return result
+
+    def _auth_failed(self, error):
+        with self._auth_lock:
+            self._auth_stats['failed'] += 1
+        raise error
+
+    @property
+    def auth_stats(self):
+        """Dict containing authentication and authentication pool metrics.
+        """
+        with self._auth_lock:
+            stats = dict(self._auth_stats)
+        if self._auth_pool is not None:
+            for key, value in self._auth_pool.stats.items():
+                stats['pool_{0}'.format(key)] = value
+        return stats
 
 
 def main():
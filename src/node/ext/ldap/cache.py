@@ -1,9 +1,28 @@
 # -*- coding: utf-8 -*-
 from bda.cache import Memcached
 from bda.cache import NullCache
+from bda.cache.interfaces import ICacheManager
+from collections import OrderedDict
+from ldap.dn import dn2str
+from ldap.dn import str2dn
 from node.ext.ldap.interfaces import ICacheProviderFactory
+from node.ext.ldap.interfaces import IChunkedCacheProvider
+from node.ext.ldap.interfaces import ILRUCacheProvider
+from node.ext.ldap.interfaces import ITieredCacheProvider
+from node.ext.ldap.serializer import COMPRESS_THRESHOLD
+from node.ext.ldap.serializer import SerializationError
+from node.ext.ldap.serializer import dumps
+from node.ext.ldap.serializer import loads
+from zope.component import adapter
+from zope.component import provideAdapter
 from zope.interface import implementer
 
+import ldap
+import sys
+import threading
+import time
+import uuid
+
 
 def nullcacheProviderFactory():
     """Default cache provider factory.
@@ -23,3 +42,672 @@ class MemcachedProviderFactory(object):
 
     def __call__(self):
         return Memcached(self.servers)
+
+
+def estimate_size(value):
+    """Estimate memory consumption of value in bytes.
+
+    Considers nested lists, tuples and dicts, as returned by LDAP searches.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.iteritems():
+            size += estimate_size(key) + estimate_size(item)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += estimate_size(item)
+    return size
+
+
+@implementer(ILRUCacheProvider)
+class LRUCache(object):
+    """Thread safe in-process cache with LRU eviction and per entry timeout.
+
+    Values are stored as is, without serialization. Thus cached values must
+    not be modified by consumers.
+    """
+
+    def __init__(self, max_entries=10000, max_size=None, timeout=0):
+        """
+        max_entries
+            Maximum number of entries.
+
+        max_size
+            Maximum estimated size of all values in bytes. None means
+            unlimited.
+
+        timeout
+            Default timeout of entries in seconds. 0 means no timeout.
+        """
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        # key -> (value, expires, size)
+        self._data = OrderedDict()
+        self._size = 0
+        self._stats = dict(hits=0, misses=0, evictions=0)
+
+    def reset(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    def size(self):
+        return self._size
+
+    def keys(self):
+        with self._lock:
+            return self._data.keys()
+
+    def values(self):
+        with self._lock:
+            return [_[0] for _ in self._data.values()]
+
+    def get(self, key, default=None):
+        with self._lock:
+            record = self._data.pop(key, None)
+            if record is None:
+                self._stats['misses'] += 1
+                return default
+            if record[1] and record[1] < time.time():
+                self._size -= record[2]
+                self._stats['misses'] += 1
+                return default
+            # reinsert as most recently used
+            self._data[key] = record
+            self._stats['hits'] += 1
+            return record[0]
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        expires = timeout and time.time() + timeout or 0
+        size = self.max_size is not None and estimate_size(value) or 0
+        if self.max_size is not None and size > self.max_size:
+            # never fits
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._size -= old[2]
+            self._data[key] = (value, expires, size)
+            self._size += size
+            while len(self._data) > self.max_entries \
+                    or (self.max_size is not None
+                        and self._size > self.max_size):
+                _, record = self._data.popitem(last=False)
+                self._size -= record[2]
+                self._stats['evictions'] += 1
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        with self._lock:
+            record = self._data.pop(key, None)
+            if record is not None:
+                self._size -= record[2]
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def stats(self):
+        """Dict containing cache metrics.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._data)
+            stats['size'] = self._size
+            return stats
+
+
+@implementer(ICacheManager)
+@adapter(ILRUCacheProvider)
+class LRUCacheManager(object):
+    """Cache manager for ``LRUCache``.
+    """
+
+    def __init__(self, context):
+        self.cache = context
+
+    def setTimeout(self, timeout):
+        self.cache.timeout = timeout
+
+    def getData(self, func, key, force_reload=False, args=[], kwargs={}):
+        ret = self.get(key, force_reload)
+        if ret is None:
+            ret = func(*args, **kwargs)
+            self.set(key, ret)
+        return ret
+
+    def get(self, key, force_reload=False):
+        if force_reload:
+            del self.cache[key]
+            return None
+        return self.cache.get(key)
+
+    def set(self, key, item):
+        self.cache[key] = item
+
+    def rem(self, key):
+        del self.cache[key]
+
+    def __delitem__(self, key):
+        del self.cache[key]
+
+
+provideAdapter(LRUCacheManager)
+
+
+@implementer(ICacheProviderFactory)
+class LRUCacheProviderFactory(object):
+    """In-process LRU cache provider factory.
+
+    Register as ``ICacheProviderFactory`` utility to use it. Each
+    communicator gets its own cache.
+    """
+
+    def __init__(self, max_entries=10000, max_size=None):
+        self.max_entries = max_entries
+        self.max_size = max_size
+
+    def __call__(self):
+        return LRUCache(max_entries=self.max_entries, max_size=self.max_size)
+
+
+# maximum size in bytes of values stored by ``ChunkedCache`` under one key.
+# Memcached refuses items above 1 MB by default
+CHUNK_SIZE = 1000000
+
+# marker of values split into chunks
+CHUNKED = 'NELC'
+
+
+@implementer(IChunkedCacheProvider)
+class ChunkedCache(object):
+    """Cache provider storing values serialized by
+    ``node.ext.ldap.serializer`` in a string based cache provider like
+    ``Memcached``.
+
+    Values larger than ``chunk_size`` get split across multiple keys. The
+    chunks are written first, so readers never see partially written values.
+    Chunks of replaced values get deleted. Values with missing chunks are
+    considered not cached.
+    """
+
+    def __init__(self, provider, chunk_size=CHUNK_SIZE,
+                 compress_threshold=COMPRESS_THRESHOLD):
+        """
+        provider
+            Cache provider storing strings.
+
+        chunk_size
+            Maximum size in bytes stored under one key.
+
+        compress_threshold
+            Minimum size in bytes of serialized values getting compressed.
+            None disables compression.
+        """
+        self.provider = provider
+        self.chunk_size = chunk_size
+        self.compress_threshold = compress_threshold
+
+    def _get_timeout(self):
+        return self.provider.timeout
+
+    def _set_timeout(self, timeout):
+        self.provider.timeout = timeout
+
+    timeout = property(_get_timeout, _set_timeout)
+
+    def _chunk_keys(self, key, header):
+        # return chunk keys and total length from chunked header
+        token, count, length = header[len(CHUNKED):].split(':')
+        keys = ['{0}:{1}:{2}'.format(key, token, i)
+                for i in range(int(count))]
+        return keys, int(length)
+
+    def reset(self):
+        self.provider.reset()
+
+    def size(self):
+        return self.provider.size()
+
+    def keys(self):
+        return self.provider.keys()
+
+    def values(self):
+        return self.provider.values()
+
+    def get(self, key, default=None):
+        data = self.provider.get(key)
+        if not isinstance(data, str):
+            return default
+        if data.startswith(CHUNKED):
+            keys, length = self._chunk_keys(key, data)
+            chunks = [self.provider.get(_) for _ in keys]
+            if None in chunks:
+                return default
+            data = ''.join(chunks)
+            if len(data) != length:
+                return default
+        try:
+            return loads(data)
+        except SerializationError:
+            return default
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def _delete_chunks(self, key, data):
+        # delete chunks of value stored under key, if chunked
+        if not isinstance(data, str) or not data.startswith(CHUNKED):
+            return
+        for chunk_key in self._chunk_keys(key, data)[0]:
+            try:
+                del self.provider[chunk_key]
+            except KeyError:
+                pass
+
+    def __setitem__(self, key, value):
+        data = dumps(value, compress_threshold=self.compress_threshold)
+        # chunks of the replaced value get deleted after writing the new one
+        old = self.provider.get(key)
+        if len(data) <= self.chunk_size:
+            self.provider[key] = data
+            self._delete_chunks(key, old)
+            return
+        # unique chunk keys per write, thus concurrent writes never mix
+        token = uuid.uuid4().hex[:8]
+        count = (len(data) + self.chunk_size - 1) // self.chunk_size
+        header = '{0}{1}:{2}:{3}'.format(CHUNKED, token, count, len(data))
+        keys, _ = self._chunk_keys(key, header)
+        for index, chunk_key in enumerate(keys):
+            start = index * self.chunk_size
+            self.provider[chunk_key] = data[start:start + self.chunk_size]
+        self.provider[key] = header
+        self._delete_chunks(key, old)
+
+    def __delitem__(self, key):
+        data = self.provider.get(key)
+        del self.provider[key]
+        self._delete_chunks(key, data)
+
+
+@implementer(ICacheManager)
+@adapter(IChunkedCacheProvider)
+class ChunkedCacheManager(LRUCacheManager):
+    """Cache manager for ``ChunkedCache``.
+    """
+
+
+provideAdapter(ChunkedCacheManager)
+
+
+@implementer(ICacheProviderFactory)
+class ChunkedCacheProviderFactory(object):
+    """Compact serializing and chunking cache provider factory.
+
+    Register as ``ICacheProviderFactory`` utility to use it, or pass it as
+    ``l2_factory`` to ``TieredCacheProviderFactory``. Wraps cache providers
+    created by ``factory``, which defaults to a ``MemcachedProviderFactory``.
+    """
+
+    def __init__(self, factory=None, chunk_size=CHUNK_SIZE,
+                 compress_threshold=COMPRESS_THRESHOLD):
+        if factory is None:
+            factory = MemcachedProviderFactory()
+        self.factory = factory
+        self.chunk_size = chunk_size
+        self.compress_threshold = compress_threshold
+
+    def __call__(self):
+        return ChunkedCache(
+            self.factory(),
+            chunk_size=self.chunk_size,
+            compress_threshold=self.compress_threshold
+        )
+
+
+@implementer(ITieredCacheProvider)
+class TieredCache(object):
+    """Two tier cache with a process local ``LRUCache`` as first tier in
+    front of a shared second tier cache provider, e.g. ``Memcached``.
+
+    Values are written to both tiers. The first tier keeps values at most
+    ``l1_timeout`` seconds, and never longer than they live in the second
+    tier. Thus values evicted from the second tier by another process are
+    seen by this process after ``l1_timeout`` seconds at latest.
+    """
+
+    def __init__(self, l1, l2, l1_timeout=5.0):
+        """
+        l1
+            ``LRUCache`` instance used as first tier.
+
+        l2
+            Cache provider used as second tier. Values are stored with their
+            expiration time.
+
+        l1_timeout
+            Maximum seconds values are kept in first tier.
+        """
+        self.l1 = l1
+        self.l2 = l2
+        self.l1_timeout = l1_timeout
+        self._lock = threading.Lock()
+        self._stats = dict(l1_hits=0, l2_hits=0, misses=0)
+
+    def _get_timeout(self):
+        return self.l2.timeout
+
+    def _set_timeout(self, timeout):
+        self.l2.timeout = timeout
+
+    timeout = property(_get_timeout, _set_timeout)
+
+    def _l1_timeout(self, expires):
+        if not expires:
+            return self.l1_timeout
+        # keep at least a tiny positive timeout, 0 means never expire
+        return max(min(self.l1_timeout, expires - time.time()), 0.001)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def reset(self):
+        self.l1.reset()
+        self.l2.reset()
+
+    def size(self):
+        return self.l1.size()
+
+    def keys(self):
+        return self.l1.keys()
+
+    def values(self):
+        return self.l1.values()
+
+    def get(self, key, default=None):
+        value = self.l1.get(key)
+        if value is not None:
+            self._count('l1_hits')
+            return value
+        record = self.l2.get(key)
+        if not isinstance(record, tuple) or len(record) != 2:
+            self._count('misses')
+            return default
+        expires, value = record
+        if expires and expires < time.time():
+            self._count('misses')
+            return default
+        self._count('l2_hits')
+        self.l1.set(key, value, timeout=self._l1_timeout(expires))
+        return value
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __setitem__(self, key, value):
+        timeout = self.timeout
+        expires = timeout and time.time() + timeout or 0
+        self.l2[key] = (expires, value)
+        self.l1.set(key, value, timeout=self._l1_timeout(expires))
+
+    def __delitem__(self, key):
+        del self.l1[key]
+        del self.l2[key]
+
+    @property
+    def stats(self):
+        """Dict containing hit and miss counts per tier.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+@implementer(ICacheManager)
+@adapter(ITieredCacheProvider)
+class TieredCacheManager(LRUCacheManager):
+    """Cache manager for ``TieredCache``.
+    """
+
+
+provideAdapter(TieredCacheManager)
+
+
+@implementer(ICacheProviderFactory)
+class TieredCacheProviderFactory(object):
+    """Two tier cache provider factory.
+
+    Register as ``ICacheProviderFactory`` utility to use it. Each
+    communicator gets its own first tier cache, the second tier is created
+    by ``l2_factory``, which defaults to a ``MemcachedProviderFactory``.
+    """
+
+    def __init__(self, l2_factory=None, l1_timeout=5.0, max_entries=1000,
+                 max_size=None):
+        if l2_factory is None:
+            l2_factory = MemcachedProviderFactory()
+        self.l2_factory = l2_factory
+        self.l1_timeout = l1_timeout
+        self.max_entries = max_entries
+        self.max_size = max_size
+
+    def __call__(self):
+        return TieredCache(
+            LRUCache(max_entries=self.max_entries, max_size=self.max_size),
+            self.l2_factory(),
+            l1_timeout=self.l1_timeout
+        )
+
+
+def normalize_dn(dn):
+    """Return normalized DN used for comparison.
+    """
+    if isinstance(dn, unicode):
+        dn = dn.encode('utf-8')
+    try:
+        return dn2str(str2dn(dn.lower()))
+    except ldap.DECODING_ERROR:
+        return dn.lower()
+
+
+def parent_dns(dn):
+    """Return list of normalized DNs of all ancestors of given normalized DN.
+    """
+    try:
+        rdns = str2dn(dn)
+    except ldap.DECODING_ERROR:
+        return list()
+    return [dn2str(rdns[i:]) for i in range(1, len(rdns))]
+
+
+class CacheIndex(object):
+    """Thread safe index of cached search results by search base and scope.
+
+    Used to find the cache keys of search results which might be affected by
+    a write to a DN. Only keys cached by this process are known.
+    """
+
+    def __init__(self, max_keys=100000):
+        """
+        max_keys
+            Maximum number of indexed keys. If exceeded, the oldest keys are
+            dropped from the index and returned by ``add`` for eviction from
+            the cache.
+        """
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        # normalized base DN -> scope -> set of keys
+        self._index = dict()
+        # key -> (normalized base DN, scope)
+        self._keys = OrderedDict()
+
+    def add(self, key, baseDN, scope):
+        """Index key of search result for base DN and scope.
+
+        Return list of keys dropped from the index, which must be evicted from
+        the cache.
+        """
+        dn = normalize_dn(baseDN)
+        dropped = list()
+        with self._lock:
+            if key in self._keys:
+                return dropped
+            self._keys[key] = (dn, scope)
+            self._index.setdefault(dn, dict()).setdefault(
+                scope, set()).add(key)
+            while len(self._keys) > self.max_keys:
+                old, _ = self._keys.popitem(last=False)
+                self._unindex(old, _)
+                dropped.append(old)
+        return dropped
+
+    def affected(self, dn, subtree=False):
+        """Return keys of search results which might contain the entry with
+        given DN, i.e. base searches on it, one level searches on its parent
+        and subtree searches on it or its ancestors.
+
+        subtree
+            Flag whether to include all searches based within the subtree of
+            DN.
+        """
+        dn = normalize_dn(dn)
+        parents = parent_dns(dn)
+        keys = set()
+        with self._lock:
+            scopes = self._index.get(dn, dict())
+            keys.update(scopes.get(ldap.SCOPE_BASE, ()))
+            keys.update(scopes.get(ldap.SCOPE_SUBTREE, ()))
+            if parents:
+                scopes = self._index.get(parents[0], dict())
+                keys.update(scopes.get(ldap.SCOPE_ONELEVEL, ()))
+            for parent in parents:
+                scopes = self._index.get(parent, dict())
+                keys.update(scopes.get(ldap.SCOPE_SUBTREE, ()))
+            if subtree:
+                suffix = ',' + dn
+                for base, scopes in self._index.items():
+                    if base == dn or base.endswith(suffix):
+                        for scoped in scopes.values():
+                            keys.update(scoped)
+        return keys
+
+    def remove(self, keys):
+        """Remove keys from index.
+        """
+        with self._lock:
+            for key in keys:
+                record = self._keys.pop(key, None)
+                if record is not None:
+                    self._unindex(key, record)
+
+    def keys(self):
+        """Return all indexed keys.
+        """
+        with self._lock:
+            return self._keys.keys()
+
+    def clear(self):
+        with self._lock:
+            self._index.clear()
+            self._keys.clear()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _unindex(self, key, record):
+        dn, scope = record
+        scopes = self._index.get(dn)
+        if scopes is None:
+            return
+        scoped = scopes.get(scope)
+        if scoped is not None:
+            scoped.discard(key)
+            if not scoped:
+                del scopes[scope]
+        if not scopes:
+            del self._index[dn]
+
+
+class MissCache(object):
+    """Thread safe in-process cache of search misses, i.e. searches failing
+    with ``ldap.NO_SUCH_OBJECT`` or returning an empty result.
+
+    Misses expire after a short timeout, and get evicted on writes to entries
+    which might be contained in the search result.
+    """
+
+    def __init__(self, timeout, max_entries=10000):
+        """
+        timeout
+            Seconds misses are cached.
+
+        max_entries
+            Maximum number of cached misses.
+        """
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        # key -> (miss, expires)
+        self._misses = dict()
+        self._index = CacheIndex(max_keys=max_entries)
+        self._stats = dict(hits=0, misses=0)
+
+    def get(self, key):
+        """Return cached miss for key, either the ``ldap.NO_SUCH_OBJECT``
+        exception or an empty list. Return None if not cached.
+        """
+        with self._lock:
+            record = self._misses.get(key)
+            if record is not None and record[1] < time.time():
+                del self._misses[key]
+                record = None
+            if record is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            miss = record[0]
+        if isinstance(miss, Exception):
+            return miss
+        return list()
+
+    def add(self, key, baseDN, scope, miss):
+        """Cache miss for key of search with base DN and scope.
+        """
+        dropped = self._index.add(key, baseDN, scope)
+        with self._lock:
+            self._misses[key] = (miss, time.time() + self.timeout)
+            for old in dropped:
+                self._misses.pop(old, None)
+
+    def invalidate(self, dn=None):
+        """Evict misses of searches which might contain the entry with given
+        DN or any entry below. Evict all misses if DN is None.
+        """
+        if dn is None:
+            keys = self._index.keys()
+        else:
+            keys = self._index.affected(dn, subtree=True)
+        self._index.remove(keys)
+        with self._lock:
+            for key in keys:
+                self._misses.pop(key, None)
+
+    def __len__(self):
+        return len(self._misses)
+
+    @property
+    def stats(self):
+        """Dict containing cache metrics.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._misses)
+            return stats
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import re
+
+
+# maximum number of memoized normalized filters
+NORMALIZED_FILTERS_MAX = 10000
+
+_normalized_filters = dict()
+
+_hex_escape = re.compile(r'\\([0-9A-Fa-f]{2})')
+
+
+def _skip(queryFilter, pos):
+    # skip whitespace between filter components
+    while pos < len(queryFilter) and queryFilter[pos] in ' \t\r\n':
+        pos += 1
+    return pos
+
+
+def _parse(queryFilter, pos):
+    # parse filter component starting at pos. return node and position after
+    # component. raise ValueError or IndexError on invalid filters
+    if queryFilter[pos] != '(':
+        raise ValueError(queryFilter)
+    pos = _skip(queryFilter, pos + 1)
+    op = queryFilter[pos]
+    if op in '&|':
+        children = list()
+        pos = _skip(queryFilter, pos + 1)
+        while queryFilter[pos] == '(':
+            child, pos = _parse(queryFilter, pos)
+            children.append(child)
+            pos = _skip(queryFilter, pos)
+        if queryFilter[pos] != ')' or not children:
+            raise ValueError(queryFilter)
+        return (op, children), pos + 1
+    if op == '!':
+        child, pos = _parse(queryFilter, _skip(queryFilter, pos + 1))
+        pos = _skip(queryFilter, pos)
+        if queryFilter[pos] != ')':
+            raise ValueError(queryFilter)
+        return (op, child), pos + 1
+    # special characters in values are escaped, thus first closing bracket
+    # terminates the item
+    end = queryFilter.index(')', pos)
+    item = queryFilter[pos:end]
+    index = item.index('=')
+    attr, value = item[:index], item[index + 1:]
+    op = '='
+    if attr[-1:] in ('~', '>', '<', ':'):
+        op = attr[-1] + op
+        attr = attr[:-1]
+    attr = attr.strip().lower()
+    if not attr:
+        raise ValueError(queryFilter)
+    value = _hex_escape.sub(lambda m: '\\' + m.group(1).lower(), value)
+    return ('item', '{0}{1}{2}'.format(attr, op, value)), end + 1
+
+
+def _render(node):
+    op, data = node
+    if op == 'item':
+        return '({0})'.format(data)
+    if op == '!':
+        return '(!{0})'.format(_render(data))
+    children = list()
+    for child in data:
+        # nested operands with same operator are merged
+        if child[0] == op:
+            children.extend(_render(_) for _ in child[1])
+        else:
+            children.append(_render(child))
+    return '({0}{1})'.format(op, ''.join(sorted(children)))
+
+
+def normalize_filter(queryFilter):
+    """Return canonical representation of LDAP filter string.
+
+    Whitespace between filter components gets removed, attribute names get
+    lowercased, nested ``&`` and ``|`` operands get merged and operands get
+    sorted. Values are not touched except hex escapes getting lowercased, as
+    matching rules might be case sensitive. Invalid filters are returned
+    unchanged.
+    """
+    normalized = _normalized_filters.get(queryFilter)
+    if normalized is not None:
+        return normalized
+    try:
+        node, pos = _parse(queryFilter, _skip(queryFilter, 0))
+        if _skip(queryFilter, pos) != len(queryFilter):
+            raise ValueError(queryFilter)
+        normalized = _render(node)
+    except (ValueError, IndexError):
+        normalized = queryFilter
+    if len(_normalized_filters) >= NORMALIZED_FILTERS_MAX:
+        _normalized_filters.clear()
+    _normalized_filters[queryFilter] = normalized
+    return normalized
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def search_cache_key(bindDN, queryFilter, scope, baseDN, attrlist, attrsonly,
+                     page_size, cookie):
+    """Return cache key for search.
+
+    The filter gets normalized, so semantically equal filters result in the
+    same key.
+    """
+    key_items = [
+        _encode(bindDN) or '',
+        _encode(baseDN) or '',
+        # ``None`` and ``[]`` request all attributes, ``['']`` none
+        repr(sorted([_encode(_) for _ in attrlist or []])),
+        attrsonly and '1' or '0',
+        normalize_filter(_encode(queryFilter)),
+        repr(scope),
+        repr(page_size),
+        cookie or '',
+    ]
+    return hashlib.md5('\x00'.join(key_items)).hexdigest()
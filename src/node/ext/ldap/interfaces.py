@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from bda.cache.interfaces import ICacheProvider
 from node.interfaces import INodeAddedEvent
 from node.interfaces import INodeCreatedEvent
 from node.interfaces import INodeDetachedEvent
@@ -19,12 +20,37 @@ class ICacheProviderFactory(Interface):
         """
 
 
+class ILRUCacheProvider(ICacheProvider):
+    """Bounded in-process cache provider with LRU eviction and per entry
+    timeout.
+    """
+
+    def set(key, value, timeout=None):
+        """Store value with key. ``timeout`` overrides the default timeout
+        in seconds for this entry.
+        """
+
+
+class ITieredCacheProvider(ICacheProvider):
+    """Cache provider with a process local first tier in front of a shared
+    second tier cache provider.
+    """
+
+
+class IChunkedCacheProvider(ICacheProvider):
+    """Cache provider storing compact serialized values, split across
+    multiple keys if large.
+    """
+
+
 class ILDAPProps(Interface):
     """LDAP properties configuration interface.
     """
 
     uri = Attribute(u'LDAP URI')
 
+    uris = Attribute(u'List of LDAP URIs for failover and load balancing')
+
     user = Attribute(u'LDAP User')
 
     password = Attribute(u'Bind Password')
@@ -55,6 +81,54 @@ class ILDAPProps(Interface):
 
     page_size = Attribute(u'Page size for LDAP queries.')
 
+    pool_min_size = Attribute(u'Minimum number of pooled connections')
+
+    pool_max_size = Attribute(u'Maximum number of pooled connections')
+
+    pool_idle_timeout = Attribute(u'Idle timeout of pooled connections')
+
+    pool_check_interval = Attribute(
+        u'Health check interval of pooled connections in seconds'
+    )
+
+    auth_pool_size = Attribute(
+        u'Maximum number of pooled authentication connections'
+    )
+
+    operation_timeout = Attribute(u'Default operation timeout in seconds')
+
+    sizelimit = Attribute(u'Default search size limit')
+
+    hedge_percentile = Attribute(u'Latency percentile for hedged searches')
+
+    hedge_delay = Attribute(u'Minimum delay of hedged searches in seconds')
+
+    write_uris = Attribute(u'List of LDAP URIs write operations are sent to')
+
+    read_your_writes = Attribute(
+        u'Seconds searches are sent to write servers after a write'
+    )
+
+    schema_ttl = Attribute(u'Seconds the subschema is used without check')
+
+    schema_cache_file = Attribute(u'Path of persisted subschema')
+
+    sync_base_dns = Attribute(u'Base DNs to follow changes of via syncrepl')
+
+    miss_timeout = Attribute(u'Seconds misses of searches are cached')
+
+    coalesce_searches = Attribute(u'Flag whether to coalesce searches')
+
+    cache_soft_timeout = Attribute(u'Seconds after which cache gets refreshed')
+
+    entry_cache = Attribute(u'Flag whether to cache entries by DN')
+
+    mirror_file = Attribute(u'Path of SQLite file used as local mirror')
+
+    mirror_base_dns = Attribute(u'Base DNs of subtrees to mirror')
+
+    mirror_attributes = Attribute(u'Attributes indexed in local mirror')
+
 
 class ILDAPPrincipalsConfig(Interface):
     """LDAP principals configuration interface.
@@ -136,6 +210,12 @@ class ILDAPStorage(IStorage):
 
     search_relation = Attribute(u'Default child search relation')
 
+    child_attrlist = Attribute(
+        u'Attributes of children fetched when iterating via ``items`` or '
+        u'``values``. Must contain ``*``, children attributes are not loaded '
+        u'separately then. Defaults to None.'
+    )
+
     child_defaults = Attribute(
         u'Default child attributes. Will be set to all children attributes'
         u'on __setitem__ if not present yet.'
@@ -146,7 +226,8 @@ class ILDAPStorage(IStorage):
         """
 
     def search(queryFilter=None, criteria=None, relation=None,
-               attrlist=None, exact_match=False, or_search=False):
+               attrlist=None, exact_match=False, or_search=False,
+               timeout=None):
         """Search the directors.
 
         All search criteria are additive and will be ``&``ed. ``queryFilter``
@@ -185,6 +266,10 @@ class ILDAPStorage(IStorage):
 
         or_search
             flag whether criteria should be ORer or ANDed. defaults to False.
+
+        timeout
+            time span in seconds the search may take. raise ``ldap.TIMEOUT``
+            if exceeded. defaults to ``operation_timeout`` of the props.
         """
 
 
@@ -0,0 +1,555 @@
+# -*- coding: utf-8 -*-
+from node.ext.ldap.cache import normalize_dn
+from node.ext.ldap.cache import parent_dns
+from node.ext.ldap.cachekey import _parse
+from node.ext.ldap.cachekey import _skip
+from node.ext.ldap.properties import MIRROR_DEFAULTS
+from node.ext.ldap.serializer import dumps
+from node.ext.ldap.serializer import loads
+from node.ext.ldap.sync import LDAPSyncListener
+import ldap
+import re
+import sqlite3
+import threading
+import time
+
+
+# version of the database layout. Mirrors with other version get rebuilt
+MIRROR_VERSION = '1'
+
+# seconds searches within the subtree of an entry written by this process are
+# sent to the server, unless the change arrived via synchronization before
+DIRTY_TIMEOUT = 10.0
+
+# attributes containing DNs, values get normalized as DN
+DN_ATTRIBUTES = set([
+    'member',
+    'uniquemember',
+    'memberof',
+    'owner',
+    'seealso',
+    'manager',
+])
+
+# well known operational attributes. They are only stored if listed in the
+# mirrored attributes, and only returned if explicitly requested
+OPERATIONAL_ATTRIBUTES = set([
+    'createtimestamp',
+    'creatorsname',
+    'modifytimestamp',
+    'modifiersname',
+    'entryuuid',
+    'entrycsn',
+    'entrydn',
+    'structuralobjectclass',
+    'subschemasubentry',
+    'hassubordinates',
+    'numsubordinates',
+    'memberof',
+    'ismemberof',
+    'pwdchangedtime',
+    'pwdaccountlockedtime',
+    'pwdfailuretime',
+    'pwdhistory',
+    'pwdpolicysubentry',
+    'pwdreset',
+    'objectguid',
+    'whencreated',
+    'whenchanged',
+    'usncreated',
+    'usnchanged',
+    'nsuniqueid',
+])
+
+# attributes matched case sensitive, values are indexed as is
+CASE_EXACT_ATTRIBUTES = set([
+    'memberuid',
+])
+
+_hex_escape = re.compile(r'\\([0-9a-f]{2})', re.I)
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS meta ('
+    '  name TEXT PRIMARY KEY,'
+    '  value TEXT)',
+    'CREATE TABLE IF NOT EXISTS entries ('
+    '  id INTEGER PRIMARY KEY,'
+    '  ndn TEXT UNIQUE,'
+    '  parent TEXT,'
+    '  root TEXT,'
+    '  uuid TEXT,'
+    '  dn TEXT,'
+    '  data BLOB)',
+    'CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent)',
+    'CREATE INDEX IF NOT EXISTS entries_uuid ON entries (uuid)',
+    'CREATE TABLE IF NOT EXISTS attrs ('
+    '  id INTEGER,'
+    '  name TEXT,'
+    '  value TEXT)',
+    'CREATE INDEX IF NOT EXISTS attrs_value ON attrs (name, value)',
+    'CREATE INDEX IF NOT EXISTS attrs_id ON attrs (id)',
+]
+
+
+def normalize_value(name, value):
+    """Return normalized value of attribute used for equality matching.
+
+    ``name`` is the lowercased attribute name.
+    """
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    if name in DN_ATTRIBUTES:
+        return normalize_dn(value)
+    if name in CASE_EXACT_ATTRIBUTES:
+        return value
+    try:
+        return value.decode('utf-8').lower().encode('utf-8')
+    except UnicodeDecodeError:
+        return value.lower()
+
+
+def _like(value):
+    # escape value for use in LIKE pattern
+    for char in ('\\', '%', '_'):
+        value = value.replace(char, '\\' + char)
+    return value
+
+
+def _condition(node, attributes):
+    # translate parsed filter node to SQL condition and parameters. raise
+    # ValueError if filter cannot be answered by the mirror
+    op, data = node
+    if op in '&|':
+        conditions = list()
+        params = list()
+        for child in data:
+            condition, child_params = _condition(child, attributes)
+            conditions.append('({0})'.format(condition))
+            params.extend(child_params)
+        join = op == '&' and ' AND ' or ' OR '
+        return join.join(conditions), params
+    if op == '!':
+        condition, params = _condition(data, attributes)
+        return 'NOT ({0})'.format(condition), params
+    index = data.index('=')
+    name, value = data[:index], data[index + 1:]
+    if name[-1:] in ('~', '>', '<', ':'):
+        raise ValueError(u"Unsupported match '{0}'".format(data))
+    if value == '*':
+        if name == 'objectclass':
+            return '1', []
+        if name not in attributes:
+            raise ValueError(u"Attribute '{0}' not indexed".format(name))
+        return 'id IN (SELECT id FROM attrs WHERE name = ?)', [name]
+    if '*' in value:
+        raise ValueError(u"Unsupported substring match '{0}'".format(data))
+    if name not in attributes:
+        raise ValueError(u"Attribute '{0}' not indexed".format(name))
+    value = _hex_escape.sub(lambda m: chr(int(m.group(1), 16)), value)
+    return (
+        'id IN (SELECT id FROM attrs WHERE name = ? AND value = ?)',
+        [name, normalize_value(name, value)]
+    )
+
+
+class LDAPMirror(object):
+    """Thread safe local read replica of subtrees of the directory stored in
+    a SQLite database.
+
+    Entries are stored with all attributes. Values of ``attributes`` are
+    indexed, searches with filters consisting of equality and presence
+    matches on indexed attributes, combined via ``&``, ``|`` and ``!``, are
+    answered locally. ``(objectClass=*)`` is supported always. Searches
+    requesting operational attributes are only answered locally if these
+    are mirrored attributes.
+
+    The mirror is kept current by ``MirrorSyncListener`` instances. Changes
+    are committed together with the synchronization cookie. Since the
+    database file persists, restarts come up with the mirror filled and only
+    changes since the last synchronization get transferred.
+    """
+
+    def __init__(self, path, base_dns, attributes=MIRROR_DEFAULTS,
+                 dirty_timeout=DIRTY_TIMEOUT):
+        """
+        path
+            Path of the database file. ``:memory:`` creates a mirror which
+            does not persist.
+
+        base_dns
+            Base DNs of mirrored subtrees.
+
+        attributes
+            Attributes whose values get indexed.
+
+        dirty_timeout
+            Seconds searches affected by writes of this process are not
+            answered locally unless the change has been synchronized.
+        """
+        self.base_dns = [normalize_dn(_) for _ in base_dns]
+        self.attributes = set([_.lower() for _ in attributes])
+        self.dirty_timeout = dirty_timeout
+        self._lock = threading.RLock()
+        self._dirty = dict()
+        self._stats = dict(hits=0, fallbacks=0)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.text_factory = str
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        with self._lock:
+            for statement in SCHEMA:
+                self._db.execute(statement)
+            layout = '{0}:{1}:{2}'.format(
+                MIRROR_VERSION,
+                ';'.join(sorted(self.base_dns)),
+                ','.join(sorted(self.attributes))
+            )
+            if self._meta('layout') != layout:
+                # configuration changed, start over
+                self._clear()
+                self._set_meta('layout', layout)
+            self._db.commit()
+
+    def _meta(self, name):
+        row = self._db.execute(
+            'SELECT value FROM meta WHERE name = ?', (name,)
+        ).fetchone()
+        return row and row[0] or None
+
+    def _set_meta(self, name, value):
+        if value is None:
+            self._db.execute('DELETE FROM meta WHERE name = ?', (name,))
+            return
+        self._db.execute(
+            'INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)',
+            (name, value)
+        )
+
+    def _clear(self):
+        self._db.execute('DELETE FROM meta')
+        self._db.execute('DELETE FROM entries')
+        self._db.execute('DELETE FROM attrs')
+
+    def clear(self):
+        """Remove all entries and synchronization state.
+        """
+        with self._lock:
+            layout = self._meta('layout')
+            self._clear()
+            self._set_meta('layout', layout)
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+    def root(self, dn):
+        """Return normalized base DN of mirrored subtree containing ``dn`` or
+        None.
+        """
+        ndn = normalize_dn(dn)
+        for base in self.base_dns:
+            if ndn == base or ndn.endswith(',' + base):
+                return base
+        return None
+
+    def cookie(self, root):
+        """Return synchronization cookie of mirrored subtree.
+        """
+        with self._lock:
+            return self._meta('cookie:' + root)
+
+    def set_cookie(self, root, cookie):
+        with self._lock:
+            self._set_meta('cookie:' + root, cookie)
+            self._db.commit()
+
+    def refreshed(self, root):
+        """Flag whether mirrored subtree has been filled completely once.
+        """
+        with self._lock:
+            return self._meta('refreshed:' + root) is not None
+
+    def set_refreshed(self, root):
+        with self._lock:
+            self._set_meta('refreshed:' + root, '1')
+            self._db.commit()
+
+    def store(self, root, dn, uuid, attrs):
+        """Store entry. Return normalized DN the entry was stored with
+        before, which differs from new one if entry was renamed or moved.
+
+        Changes get committed with the next cookie.
+        """
+        ndn = normalize_dn(dn)
+        parents = parent_dns(ndn)
+        parent = parents and parents[0] or ''
+        data = sqlite3.Binary(dumps([(dn, attrs)]))
+        with self._lock:
+            row = self._db.execute(
+                'SELECT id, ndn FROM entries WHERE uuid = ?', (uuid,)
+            ).fetchone()
+            if row is None:
+                row = self._db.execute(
+                    'SELECT id, ndn FROM entries WHERE ndn = ?', (ndn,)
+                ).fetchone()
+            old_ndn = None
+            if row is None:
+                id = self._db.execute(
+                    'INSERT INTO entries (ndn, parent, root, uuid, dn, data) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (ndn, parent, root, uuid, dn, data)
+                ).lastrowid
+            else:
+                # keep id, results are returned in order of creation
+                id, old_ndn = row
+                if old_ndn != ndn:
+                    # moved onto DN of entry not deleted yet
+                    replaced = self._db.execute(
+                        'SELECT id FROM entries WHERE ndn = ?', (ndn,)
+                    ).fetchone()
+                    if replaced is not None:
+                        self._remove(replaced[0])
+                self._db.execute(
+                    'UPDATE entries SET ndn = ?, parent = ?, root = ?, '
+                    'uuid = ?, dn = ?, data = ? WHERE id = ?',
+                    (ndn, parent, root, uuid, dn, data, id)
+                )
+                self._db.execute('DELETE FROM attrs WHERE id = ?', (id,))
+            values = list()
+            for name, attr_values in attrs.items():
+                name = name.lower()
+                if name not in self.attributes:
+                    continue
+                for value in set([normalize_value(name, _)
+                                  for _ in attr_values]):
+                    values.append((id, name, value))
+            self._db.executemany(
+                'INSERT INTO attrs (id, name, value) VALUES (?, ?, ?)',
+                values
+            )
+            self._dirty.pop(ndn, None)
+            self._dirty.pop(old_ndn, None)
+        return old_ndn
+
+    def _remove(self, id):
+        self._db.execute('DELETE FROM entries WHERE id = ?', (id,))
+        self._db.execute('DELETE FROM attrs WHERE id = ?', (id,))
+
+    def delete(self, uuid):
+        """Delete entry by UUID. Return normalized DN of deleted entry or
+        None if unknown.
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT id, ndn FROM entries WHERE uuid = ?', (uuid,)
+            ).fetchone()
+            if row is None:
+                return None
+            id, ndn = row
+            self._remove(id)
+            self._dirty.pop(ndn, None)
+        return ndn
+
+    def delete_missing(self, root, uuids):
+        """Delete entries of mirrored subtree whose UUID is not contained in
+        ``uuids``. Return number of deleted entries.
+        """
+        with self._lock:
+            missing = [
+                id for id, uuid in self._db.execute(
+                    'SELECT id, uuid FROM entries WHERE root = ?', (root,)
+                ) if uuid not in uuids
+            ]
+            for id in missing:
+                self._remove(id)
+            self._db.commit()
+        return len(missing)
+
+    def mark_dirty(self, dn):
+        """Mark entry written by this process. Searches which might contain
+        the entry are sent to the server until the change has been
+        synchronized or ``dirty_timeout`` expired.
+        """
+        with self._lock:
+            self._dirty[normalize_dn(dn)] = time.time()
+
+    def _affected(self, base):
+        # check whether subtree of base contains dirty entries
+        now = time.time()
+        for ndn, written in self._dirty.items():
+            if now - written >= self.dirty_timeout:
+                del self._dirty[ndn]
+                continue
+            if ndn == base or ndn.endswith(',' + base):
+                return True
+        return False
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM entries'
+            ).fetchone()[0]
+
+    @property
+    def stats(self):
+        """Dict containing counts of searches answered locally and sent to
+        the server.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def search(self, queryFilter, scope, baseDN, attrlist=None, attrsonly=0,
+               page_size=None, cookie=None, sizelimit=None):
+        """Search the mirror. Arguments are the ones of
+        ``LDAPCommunicator.search``.
+
+        Return None if search cannot be answered locally. Paged searches
+        return the complete result as first and only page.
+        """
+        with self._lock:
+            res = self._search(queryFilter, scope, baseDN, attrlist,
+                               attrsonly, cookie, sizelimit)
+            if res is None:
+                self._stats['fallbacks'] += 1
+                return None
+            self._stats['hits'] += 1
+        if page_size:
+            return res, ''
+        return res
+
+    def _search(self, queryFilter, scope, baseDN, attrlist, attrsonly,
+                cookie, sizelimit):
+        if attrsonly or cookie:
+            return None
+        names = set([_.lower() for _ in attrlist or []])
+        if '+' in names or [_ for _ in names if _.startswith('@')]:
+            return None
+        if names & (OPERATIONAL_ATTRIBUTES - self.attributes):
+            # operational attributes not stored
+            return None
+        root = self.root(baseDN)
+        if root is None or self._meta('refreshed:' + root) is None:
+            return None
+        base = normalize_dn(baseDN)
+        if self._affected(base):
+            return None
+        if not isinstance(queryFilter, basestring):
+            queryFilter = str(queryFilter)
+        if isinstance(queryFilter, unicode):
+            queryFilter = queryFilter.encode('utf-8')
+        try:
+            node, pos = _parse(queryFilter, _skip(queryFilter, 0))
+            if _skip(queryFilter, pos) != len(queryFilter):
+                return None
+            condition, params = _condition(node, self.attributes)
+        except (ValueError, IndexError):
+            return None
+        if scope == ldap.SCOPE_BASE:
+            scope_condition, scope_params = 'ndn = ?', [base]
+        elif scope == ldap.SCOPE_ONELEVEL:
+            scope_condition, scope_params = 'parent = ?', [base]
+        elif base == root:
+            scope_condition, scope_params = 'root = ?', [root]
+        else:
+            scope_condition = "(ndn = ? OR ndn LIKE ? ESCAPE '\\')"
+            scope_params = [base, '%,' + _like(base)]
+        rows = self._db.execute(
+            'SELECT data FROM entries WHERE {0} AND ({1}) '
+            'ORDER BY id'.format(scope_condition, condition),
+            scope_params + params
+        ).fetchall()
+        if not rows \
+                and self._db.execute('SELECT 1 FROM entries WHERE ndn = ?',
+                                     (base,)).fetchone() is None:
+            # let the server raise NO_SUCH_OBJECT
+            return None
+        if sizelimit and len(rows) > sizelimit:
+            # let the server raise SIZELIMIT_EXCEEDED
+            return None
+        all_attrs = not attrlist or '*' in names
+        res = list()
+        for data, in rows:
+            dn, attrs = loads(str(data))[0]
+            # operational attributes are only returned if requested
+            attrs = dict([
+                (name, values) for name, values in attrs.items()
+                if name.lower() in names
+                or (all_attrs and name.lower() not in OPERATIONAL_ATTRIBUTES)
+            ])
+            res.append((dn, attrs))
+        return res
+
+
+class MirrorSyncListener(LDAPSyncListener):
+    """Listener filling a ``LDAPMirror`` with a subtree of the directory and
+    applying changes as they arrive.
+
+    The synchronization cookie is persisted in the mirror, thus after a
+    restart only changes since the last synchronization are transferred.
+    Cached search results of the communicator affected by changes get
+    evicted.
+    """
+
+    def __init__(self, communicator, mirror, baseDN, **kw):
+        """
+        communicator
+            ``LDAPCommunicator`` instance whose cache gets invalidated.
+
+        mirror
+            ``LDAPMirror`` instance to fill.
+
+        baseDN
+            Base DN of mirrored subtree.
+
+        See ``LDAPSyncListener`` for further keyword arguments.
+        """
+        kw['attrlist'] = ['*'] + sorted(mirror.attributes)
+        LDAPSyncListener.__init__(self, communicator, baseDN, **kw)
+        self.mirror = mirror
+        self.root = normalize_dn(baseDN)
+        self.cookie = mirror.cookie(self.root)
+        self._present = set()
+
+    def cookie_changed(self, cookie):
+        self.cookie = cookie
+        self.mirror.set_cookie(self.root, cookie)
+
+    def entry_changed(self, dn, uuid, attrs=None):
+        old_dn = self.mirror.store(self.root, dn, uuid, attrs or dict())
+        if not self._refreshed:
+            self._present.add(uuid)
+            return
+        self._stats['changed'] += 1
+        if old_dn is not None and old_dn != normalize_dn(dn):
+            # renamed or moved
+            self.communicator.invalidate(old_dn, subtree=True)
+        self.communicator.invalidate(dn)
+
+    def entry_deleted(self, uuid):
+        dn = self.mirror.delete(uuid)
+        if not self._refreshed:
+            return
+        self._stats['deleted'] += 1
+        if dn is not None:
+            self.communicator.invalidate(dn, subtree=True)
+
+    def entries_present(self, uuids, deletes=False):
+        if uuids is not None:
+            self._present.update(uuids)
+            return
+        if not deletes:
+            self._stats['deleted'] += self.mirror.delete_missing(
+                self.root, self._present
+            )
+        self._present = set()
+
+    def refresh_done(self):
+        self.mirror.set_refreshed(self.root)
+        LDAPSyncListener.refresh_done(self)
+
+    def _connect(self):
+        # present entries of a broken refresh are not reliable
+        self._present = set()
+        return LDAPSyncListener._connect(self)
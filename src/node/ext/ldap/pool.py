@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+from contextlib import contextmanager
+import ldap
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger('node.ext.ldap')
+
+
+class PoolExhausted(RuntimeError):
+    """Raised by non-blocking checkout from exclusive pool if all
+    connections are in use.
+    """
+
+
+class PooledConnection(object):
+    """Book keeping wrapper around a bound LDAP connection object.
+    """
+
+    def __init__(self, con):
+        self.con = con
+        self.users = 0
+        self.pins = 0
+        self.created = self.last_used = self.last_checked = time.time()
+
+    @property
+    def idle(self):
+        return not self.users and not self.pins
+
+
+class LDAPConnectionPool(object):
+    """Thread safe pool of bound LDAP connections.
+
+    Connections are created on demand by the given connector up to
+    ``max_size``. If all connections are in use, the least used connection
+    gets shared. python-ldap serializes calls on a single connection object,
+    so sharing is safe and the pool only blocks while all connections are
+    being opened. With ``max_size=1`` the pool behaves like a single
+    connection. Connections are opened and health checked without holding
+    the lock of the pool, thus slow servers do not block other threads.
+
+    Exclusive pools never share connections, checkout blocks until a
+    connection gets available instead, or raises ``PoolExhausted`` if not
+    blocking. They are used for connections which get rebound, e.g. for
+    authentication.
+
+    Connections used for paged searches get pinned to the returned paging
+    cookie, since cookies are only valid for the connection they have been
+    issued on.
+    """
+
+    def __init__(self, connector, min_size=0, max_size=1, idle_timeout=300.0,
+                 check_interval=60.0, check_timeout=5.0, bind=True,
+                 exclusive=False, uri=None, write=False):
+        """
+        connector
+            ``LDAPConnector`` instance used to create new connections.
+
+        min_size
+            Number of connections kept open even if idle.
+
+        max_size
+            Maximum number of connections.
+
+        idle_timeout
+            Seconds after which idle connections above ``min_size`` and
+            abandoned paging pins get closed.
+
+        check_interval
+            Seconds a connection may stay unused before it gets health
+            checked on next checkout.
+
+        check_timeout
+            Seconds the health check may take before the connection gets
+            discarded.
+
+        bind
+            Flag whether new connections get bound with the credentials of
+            the connector.
+
+        exclusive
+            Flag whether connections are never shared.
+
+        uri
+            URI of the server to connect to. If None, the server is selected
+            by the connector.
+
+        write
+            Flag whether to connect to write servers of the connector.
+        """
+        if max_size < 1:
+            raise ValueError(u"Pool max_size must be at least 1.")
+        self._connector = connector
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.bind = bind
+        self.exclusive = exclusive
+        self.uri = uri
+        self.write = write
+        self._lock = threading.Condition(threading.RLock())
+        self._connections = list()
+        self._checked_out = dict()
+        self._pinned = dict()
+        # number of connections being opened outside of the lock
+        self._opening = 0
+        self._stats = dict(
+            created=0,
+            discarded=0,
+            checkouts=0,
+            shared=0,
+            waits=0
+        )
+
+    def fill(self):
+        """Open connections up to ``min_size``.
+        """
+        while True:
+            with self._lock:
+                if len(self._connections) + self._opening >= self.min_size:
+                    return
+                self._opening += 1
+            self._open()
+
+    def checkout(self, cookie=None, block=True):
+        """Return a bound connection object.
+
+        cookie
+            Paging cookie. If a connection is pinned for it, this connection
+            is returned.
+
+        block
+            Flag whether to wait for a connection getting available if all
+            connections of an exclusive pool are in use. If False,
+            ``PoolExhausted`` is raised instead.
+        """
+        with self._lock:
+            self.reap()
+            self._stats['checkouts'] += 1
+        while True:
+            with self._lock:
+                pooled, check = self._reserve(cookie, block)
+            if pooled is None:
+                # a slot has been reserved, connect outside of the lock
+                return self._open(use=True).con
+            # health check is done outside of the lock, the connection is
+            # reserved and thus not handed out to other threads meanwhile
+            if not check or self._check(pooled):
+                return pooled.con
+            self.checkin(pooled.con, discard=True)
+
+    def checkin(self, con, discard=False):
+        """Return connection object to the pool.
+
+        discard
+            Flag whether connection is broken and should be closed.
+        """
+        with self._lock:
+            pooled = self._checked_out.get(id(con))
+            if pooled is None:
+                return
+            pooled.users -= 1
+            pooled.last_used = time.time()
+            if not pooled.users:
+                del self._checked_out[id(con)]
+            if discard:
+                self._discard(pooled)
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self, cookie=None):
+        """Context manager for checkout and checkin of a connection.
+
+        The connection gets discarded if ``ldap.SERVER_DOWN`` is raised.
+        """
+        con = self.checkout(cookie=cookie)
+        try:
+            yield con
+        except ldap.SERVER_DOWN:
+            self.checkin(con, discard=True)
+            raise
+        except Exception:
+            self.checkin(con)
+            raise
+        self.checkin(con)
+
+    def pin(self, cookie, con):
+        """Pin connection to paging cookie.
+        """
+        with self._lock:
+            pooled = self._lookup(con)
+            if pooled is None or cookie in self._pinned:
+                return
+            pooled.pins += 1
+            self._pinned[cookie] = (pooled, time.time())
+
+    def unpin(self, cookie):
+        """Release pin for paging cookie.
+        """
+        with self._lock:
+            pooled, _ = self._pinned.pop(cookie, (None, None))
+            if pooled is not None:
+                pooled.pins -= 1
+
+    def pinned(self, cookie):
+        """Check whether a connection is pinned for paging cookie.
+        """
+        with self._lock:
+            return cookie in self._pinned
+
+    def reap(self):
+        """Close connections idle longer than ``idle_timeout`` while more
+        than ``min_size`` connections are open, and drop pins of abandoned
+        paged searches.
+        """
+        with self._lock:
+            now = time.time()
+            for cookie, (pooled, pinned) in self._pinned.items():
+                if now - pinned > self.idle_timeout:
+                    self.unpin(cookie)
+            for pooled in list(self._connections):
+                if len(self._connections) <= self.min_size:
+                    break
+                if pooled.idle and now - pooled.last_used > self.idle_timeout:
+                    self._discard(pooled)
+
+    def purge(self, uri):
+        """Close idle connections to given URI, e.g. if server is down.
+        """
+        with self._lock:
+            for pooled in list(self._connections):
+                if pooled.idle and getattr(pooled.con, '_uri', None) == uri:
+                    self._discard(pooled)
+
+    def close(self):
+        """Unbind and remove all connections.
+        """
+        with self._lock:
+            for pooled in list(self._connections):
+                self._discard(pooled)
+            self._checked_out.clear()
+            self._pinned.clear()
+
+    @property
+    def stats(self):
+        """Dict containing pool metrics.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._connections)
+            stats['in_use'] = len([
+                _ for _ in self._connections if _.users
+            ])
+            stats['pinned'] = len(self._pinned)
+            return stats
+
+    def _create(self):
+        return PooledConnection(
+            self._connector.connect(bind=self.bind, uri=self.uri,
+                                    write=self.write)
+        )
+
+    def _lookup(self, con):
+        for pooled in self._connections:
+            if pooled.con is con:
+                return pooled
+        return None
+
+    def _reserve(self, cookie, block):
+        # mark connection as used. Return it along with flag whether it needs
+        # to be health checked. If a new connection needs to be opened, a
+        # slot is reserved and None is returned. Must be called while holding
+        # the lock
+        pooled = None
+        if cookie:
+            pooled = self._pinned.get(cookie, (None, None))[0]
+        while pooled is None:
+            pooled = self._checkout_idle()
+            if pooled is None \
+                    and len(self._connections) + self._opening \
+                    < self.max_size:
+                self._opening += 1
+                return None, False
+            if pooled is None and self.exclusive and not block:
+                raise PoolExhausted(u"All connections in use.")
+            if pooled is None and (self.exclusive or not self._connections):
+                # nothing to share if all connections are being opened
+                self._stats['waits'] += 1
+                self._lock.wait()
+            elif pooled is None:
+                pooled = min(self._connections, key=lambda x: x.users)
+                self._stats['shared'] += 1
+        check = not pooled.users and not pooled.pins \
+            and time.time() - pooled.last_checked > self.check_interval
+        pooled.users += 1
+        pooled.last_used = time.time()
+        self._checked_out.setdefault(id(pooled.con), pooled)
+        return pooled, check
+
+    def _open(self, use=False):
+        # open connection for a reserved slot without holding the lock. The
+        # slot is released if connecting fails
+        try:
+            pooled = self._create()
+        except Exception:
+            with self._lock:
+                self._opening -= 1
+                self._lock.notify_all()
+            raise
+        with self._lock:
+            self._opening -= 1
+            self._stats['created'] += 1
+            self._connections.append(pooled)
+            if use:
+                pooled.users += 1
+                pooled.last_used = time.time()
+                self._checked_out.setdefault(id(pooled.con), pooled)
+            self._lock.notify_all()
+        return pooled
+
+    def _checkout_idle(self):
+        for pooled in self._connections:
+            if pooled.idle:
+                return pooled
+        return None
+
+    def _check(self, pooled):
+        # cheap root DSE read without attributes
+        try:
+            pooled.con.search_ext_s('', ldap.SCOPE_BASE,
+                                    '(objectClass=*)', ['1.1'],
+                                    timeout=self.check_timeout)
+        except ldap.LDAPError:
+            logger.warning(u"Discard broken LDAP connection from pool.")
+            return False
+        pooled.last_checked = time.time()
+        return True
+
+    def _discard(self, pooled):
+        if pooled in self._connections:
+            self._connections.remove(pooled)
+        for cookie, (pinned, _) in self._pinned.items():
+            if pinned is pooled:
+                del self._pinned[cookie]
+        self._stats['discarded'] += 1
+        try:
+            pooled.con.unbind_s()
+        except ldap.LDAPError:
+            pass
@@ -11,6 +11,18 @@ MULTIVALUED_DEFAULTS = set([
 ])
 
 
+MIRROR_DEFAULTS = set([
+    'objectClass',
+    'uid',
+    'cn',
+    'mail',
+    'member',
+    'uniqueMember',
+    'memberUid',
+    'memberOf'
+])
+
+
 BINARY_DEFAULTS = set([
     # core.schema
     'userCertificate',
@@ -52,7 +64,29 @@ class LDAPServerProperties(object):
         retry_delay=10.0,
         multivalued_attributes=MULTIVALUED_DEFAULTS,
         binary_attributes=BINARY_DEFAULTS,
-        page_size=1000
+        page_size=1000,
+        pool_min_size=0,
+        pool_max_size=1,
+        pool_idle_timeout=300.0,
+        pool_check_interval=60.0,
+        auth_pool_size=1,
+        uris=None,
+        operation_timeout=None,
+        sizelimit=0,
+        hedge_percentile=None,
+        hedge_delay=0.05,
+        write_uris=None,
+        read_your_writes=0.0,
+        schema_ttl=3600.0,
+        schema_cache_file=None,
+        sync_base_dns=None,
+        miss_timeout=0,
+        coalesce_searches=False,
+        cache_soft_timeout=0,
+        entry_cache=False,
+        mirror_file=None,
+        mirror_base_dns=None,
+        mirror_attributes=MIRROR_DEFAULTS
     ):
         """Take the connection properties as arguments.
 
@@ -113,12 +147,14 @@ class LDAPServerProperties(object):
             Not yet
 
         retry_max
-            Maximum count of reconnect trials
-            Not yet
+            Maximum count of retries of idempotent operations, i.e. searches
+            and authentication, on a new connection if the server is not
+            reachable. Defaults to 1.
 
         retry_delay
-            Time span to wait between two reconnect trials
-            Not yet
+            Time span in seconds between two probe trials of servers marked
+            down. Only takes effect if multiple ``uris`` are given. Defaults
+            to 10.
 
         multivalued_attributes
             Set of attributes names considered as multivalued to be returned
@@ -133,13 +169,132 @@ class LDAPServerProperties(object):
             Number of objects requested at once.
             In iterations after this number of objects a new search query is
             sent for the next batch using returned the LDAP cookie.
+
+        pool_min_size
+            Number of bound connections kept open in the connection pool even
+            if idle, defaults to 0.
+
+        pool_max_size
+            Maximum number of bound connections in the connection pool,
+            defaults to 1. If all connections are in use, connections are
+            shared between threads.
+
+        pool_idle_timeout
+            Time span in seconds after which idle pooled connections get
+            closed, defaults to 300.
+
+        pool_check_interval
+            Time span in seconds after which an unused pooled connection gets
+            health checked before reuse, defaults to 60.
+
+        auth_pool_size
+            Maximum number of connections used to verify user credentials,
+            defaults to 1. Authentication connections are rebound per
+            credential check and never shared between threads.
+
+        operation_timeout
+            Default time span in seconds an operation may take. Expired
+            requests get abandoned and ``ldap.TIMEOUT`` is raised. Also sent
+            to the server as search time limit. Defaults to None, which means
+            no timeout.
+
+        sizelimit
+            Default maximum number of entries returned by a search. Exceeding
+            it raises ``ldap.SIZELIMIT_EXCEEDED``. Defaults to 0, which means
+            no client side limit.
+
+        hedge_percentile
+            Enables hedged searches if multiple ``uris`` are given. If a
+            server did not answer a search within this percentile of
+            observed search latencies, e.g. 95, the search is sent to a
+            second server as well. The first answer is used, the other
+            request gets abandoned. Only applies to searches without paging.
+            Defaults to None, which means no hedging.
+
+        hedge_delay
+            Minimum time span in seconds before a hedged search is sent. Also
+            used until enough latencies have been observed. Defaults to 0.05.
+
+        write_uris
+            List of writable LDAP URIs, given like ``uris``. If set, add,
+            modify, delete and password operations are sent to these
+            servers, while searches go to ``uris``. Defaults to None, which
+            means all operations go to ``uris``.
+
+        read_your_writes
+            Time span in seconds in which searches of a thread are sent to
+            the write servers after it performed a write, so replication lag
+            is not visible to the writer. Only takes effect if
+            ``write_uris`` is set. Defaults to 0.
+
+        schema_ttl
+            Time span in seconds the subschema is used without checking the
+            ``modifyTimestamp`` of the subschema entry, defaults to 3600.
+
+        schema_cache_file
+            Path of a JSON file the subschema entry gets persisted to, so
+            cold starts skip the schema download. Defaults to None.
+
+        sync_base_dns
+            List of base DNs to follow changes of via RFC 4533 content
+            synchronization. Cached search results get evicted as changes
+            arrive. Requires caching being enabled and the ``syncprov``
+            overlay on the server. Defaults to None.
+
+        miss_timeout
+            Seconds searches for missing entries, i.e. failing with
+            ``NO_SUCH_OBJECT`` or returning an empty result, are cached in
+            process. Avoids repeated round trips for lookups of unknown keys.
+            Misses get evicted on writes through this library. 0 disables
+            caching of misses. Defaults to 0.
+
+        coalesce_searches
+            Flag whether concurrent identical searches share one request to
+            the server. Searches are identical if they would share a cache
+            entry. Works with caching disabled as well. Waiting searches get
+            the result of the search in progress, even if they have been
+            started after an entry changed on the server by another client.
+            Defaults to False.
+
+        cache_soft_timeout
+            Seconds after which cached search results are considered stale.
+            Stale results are returned immediately while refreshed in
+            background. Callers only block if no result is cached, i.e.
+            after cache ``timeout``. 0 disables stale while revalidate mode.
+            Defaults to 0.
+
+        entry_cache
+            Flag whether to cache search results as list of DNs per query and
+            attributes per entry. Entries are stored once, no matter how many
+            cached queries contain them, and missing entries are fetched at
+            once. Only takes effect if cache is enabled. Defaults to False.
+
+        mirror_file
+            Path of SQLite database file used as local read replica of the
+            subtrees of ``mirror_base_dns``, which is kept current via RFC
+            4533 content synchronization. Searches with filters consisting
+            of equality and presence matches on ``mirror_attributes`` are
+            answered from the mirror, others are sent to the server. The
+            file persists between restarts. Should only be used with shared
+            sessions. See ``node.ext.ldap.mirror``. Defaults to None.
+
+        mirror_base_dns
+            List of base DNs of subtrees to mirror. Defaults to None.
+
+        mirror_attributes
+            Attributes indexed in the mirror. Operational attributes, e.g.
+            ``memberOf``, are only contained in mirrored entries if listed
+            here. Defaults to ``MIRROR_DEFAULTS``.
         """
+        if uris:
+            uri = isinstance(uris[0], basestring) and uris[0] or uris[0][0]
         if uri is None:
             # old school
             self.server = server or 'localhost'
             self.port = port or 389
             uri = "ldap://%s:%d/" % (self.server, self.port)
         self.uri = uri
+        self.uris = uris
         self.user = user
         self.password = password
         self.cache = cache
@@ -155,5 +310,26 @@ class LDAPServerProperties(object):
         self.multivalued_attributes = multivalued_attributes
         self.binary_attributes = binary_attributes
         self.page_size = page_size
+        self.pool_min_size = pool_min_size
+        self.pool_max_size = pool_max_size
+        self.pool_idle_timeout = pool_idle_timeout
+        self.pool_check_interval = pool_check_interval
+        self.auth_pool_size = auth_pool_size
+        self.operation_timeout = operation_timeout
+        self.sizelimit = sizelimit
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.write_uris = write_uris
+        self.read_your_writes = read_your_writes
+        self.schema_ttl = schema_ttl
+        self.schema_cache_file = schema_cache_file
+        self.sync_base_dns = sync_base_dns
+        self.miss_timeout = miss_timeout
+        self.coalesce_searches = coalesce_searches
+        self.cache_soft_timeout = cache_soft_timeout
+        self.entry_cache = entry_cache
+        self.mirror_file = mirror_file
+        self.mirror_base_dns = mirror_base_dns
+        self.mirror_attributes = mirror_attributes
 
 LDAPProps = LDAPServerProperties
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from node.ext.ldap.base import LDAPCommunicator
+from node.ext.ldap.base import LDAPConnector
+
+import threading
+
+
+_lock = threading.RLock()
+_communicators = dict()
+
+
+def _freeze(value):
+    # hashable representation of a props value
+    if isinstance(value, dict):
+        return tuple(sorted([(k, _freeze(v)) for k, v in value.items()]))
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted([_freeze(_) for _ in value]))
+    if isinstance(value, (list, tuple)):
+        return tuple([_freeze(_) for _ in value])
+    return value
+
+
+def props_key(props):
+    """Return registry key for ``LDAPProps`` instance.
+
+    Props with equal values, i.e. same servers, bind identity and
+    configuration, result in the same key.
+    """
+    return _freeze(vars(props))
+
+
+def communicator(props, bind=False, key=None):
+    """Return ``LDAPCommunicator`` shared by all sessions using equal props.
+
+    Sharing the communicator means sharing the connection pools and the
+    cache.
+
+    If ``bind`` is True, the communicator gets bound unless already done.
+    Binding happens while holding the registry lock, thus concurrent callers
+    do not create several pools.
+
+    ``key`` is the result of ``props_key`` for props, if already computed.
+
+    Shared communicators are owned by the registry and must not be unbound
+    by their users, use ``clear`` for shutdown.
+    """
+    if key is None:
+        key = props_key(props)
+    with _lock:
+        shared = _communicators.get(key)
+        if shared is None:
+            shared = LDAPCommunicator(LDAPConnector(props=props))
+            _communicators[key] = shared
+        if bind and shared._pool is None:
+            shared.bind()
+        return shared
+
+
+def clear():
+    """Unbind and remove all shared communicators.
+
+    Shuts down the connection pools, sync listeners and server monitors of
+    all shared communicators. Sessions using them get a new communicator on
+    their next connecting operation.
+    """
+    with _lock:
+        for shared in _communicators.values():
+            shared.unbind()
+            connector = shared._connector
+            connector._servers.stop()
+            if connector._write_servers is not None:
+                connector._write_servers.stop()
+        _communicators.clear()
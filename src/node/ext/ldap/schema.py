@@ -1,27 +1,83 @@
 # -*- coding: utf-8 -*-
-from node.ext.ldap import LDAPCommunicator
-from node.ext.ldap import LDAPConnector
+from node.ext.ldap import registry
+import json
 import ldap
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger('node.ext.ldap')
+
+SUBSCHEMA_DN = 'cn=subschema'
+
+# parsed subschema per server URI, shared by all ``LDAPSchemaInfo`` instances
+_subschemas = dict()
+_lock = threading.RLock()
+
+
+def clear_subschema_cache():
+    """Clear process wide subschema cache.
+    """
+    with _lock:
+        _subschemas.clear()
 
 
 class LDAPSchemaInfo(object):
+    """Access to the subschema of the LDAP server.
+
+    The parsed subschema is cached process wide per server URI. After
+    ``schema_ttl`` seconds of the props, the ``modifyTimestamp`` of the
+    subschema entry is compared to the cached one, and the subschema is only
+    downloaded and parsed again if it changed. If ``schema_cache_file`` is
+    configured, the subschema entry is persisted as JSON and parsed on cold
+    start.
+    """
 
     def __init__(self, props=None):
         self._props = props
 
     @property
     def subschema(self):
-        if hasattr(self, '_subschema'):
-            return self._subschema
-        connector = LDAPConnector(props=self._props)
-        communicator = LDAPCommunicator(connector)
-        communicator.bind()
+        uri = self._props.uri
+        ttl = getattr(self._props, 'schema_ttl', 3600.0)
+        with _lock:
+            cached = _subschemas.get(uri)
+        if cached is None:
+            cached = self._read_cache_file()
+        if cached is not None and time.time() - cached['checked'] < ttl:
+            return cached['subschema']
+        # fetched without holding the lock, thus a slow server does not
+        # block threads using other servers. Concurrent threads might fetch
+        # it twice, the last one wins. The shared communicator is used
+        # instead of opening a new connection
+        communicator = registry.communicator(self._props, bind=True)
+        if cached is not None:
+            res = communicator.search('(objectclass=*)', ldap.SCOPE_BASE,
+                                      SUBSCHEMA_DN, force_reload=True,
+                                      attrlist=['modifyTimestamp'])
+            if res and self._timestamp(res[0][1]) == cached['timestamp']:
+                cached = dict(cached, checked=time.time())
+                with _lock:
+                    _subschemas[uri] = cached
+                return cached['subschema']
         res = communicator.search('(objectclass=*)', ldap.SCOPE_BASE,
-                                  'cn=subschema', attrlist=['*', '+'])
+                                  SUBSCHEMA_DN, force_reload=True,
+                                  attrlist=['*', '+'])
         if len(res) != 1:
             raise ValueError('subschema not found')
-        self._subschema = ldap.schema.SubSchema(ldap.cidict.cidict(res[0][1]))
-        return self._subschema
+        entry = res[0][1]
+        cached = {
+            'uri': uri,
+            'timestamp': self._timestamp(entry),
+            'checked': time.time(),
+            'subschema': ldap.schema.SubSchema(ldap.cidict.cidict(entry)),
+        }
+        with _lock:
+            _subschemas[uri] = cached
+        self._write_cache_file(cached, entry)
+        return cached['subschema']
 
     def attribute(self, name):
         return self.subschema.get_obj(ldap.schema.AttributeType, name)
@@ -45,3 +101,62 @@ class LDAPSchemaInfo(object):
             record['info'] = self.attribute(at)
             res.append(record)
         return res
+
+    def _timestamp(self, entry):
+        for key, value in entry.items():
+            if key.lower() == 'modifytimestamp':
+                return value[0]
+        return None
+
+    def _read_cache_file(self):
+        # read persisted subschema entry and parse it. It gets verified
+        # against the server before used
+        path = getattr(self._props, 'schema_cache_file', None)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as cache_file:
+                persisted = json.load(cache_file)
+            if persisted.get('uri') != self._props.uri:
+                return None
+            entry = dict([
+                (key.encode('utf-8'), [_.encode('utf-8') for _ in value])
+                for key, value in persisted['entry'].items()
+            ])
+            subschema = ldap.schema.SubSchema(ldap.cidict.cidict(entry))
+            timestamp = persisted.get('timestamp')
+            if timestamp is not None:
+                timestamp = timestamp.encode('utf-8')
+        except Exception:
+            logger.warning(u"Cannot read subschema cache file {0}".format(
+                path
+            ))
+            return None
+        return {
+            'uri': self._props.uri,
+            'timestamp': timestamp,
+            'checked': 0,
+            'subschema': subschema,
+        }
+
+    def _write_cache_file(self, cached, entry):
+        # persist the raw subschema entry as JSON
+        path = getattr(self._props, 'schema_cache_file', None)
+        if not path:
+            return
+        persisted = {
+            'uri': cached['uri'],
+            'timestamp': cached['timestamp'],
+            'entry': entry,
+        }
+        # write to temporary file and rename to avoid partially written
+        # cache files being read by other processes
+        tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as cache_file:
+                json.dump(persisted, cache_file)
+            os.rename(tmp_path, path)
+        except Exception:
+            logger.warning(u"Cannot write subschema cache file {0}".format(
+                path
+            ))
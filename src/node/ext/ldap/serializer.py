@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import cPickle
+import marshal
+import zlib
+
+
+# format identifier and version
+MAGIC = 'NEL1'
+
+# flags
+COMPRESSED = 1
+
+# default minimum size in bytes of serialized values getting compressed
+COMPRESS_THRESHOLD = 4096
+
+
+class SerializationError(ValueError):
+    """Raised if data cannot be deserialized.
+    """
+
+
+def _is_result(value):
+    # check whether value is a search result, i.e. list of (dn, attrs)
+    if not isinstance(value, list) or not value:
+        return False
+    for item in value:
+        if not isinstance(item, tuple) or len(item) != 2 \
+                or not isinstance(item[1], dict):
+            return False
+    return True
+
+
+def _pack(value):
+    if _is_result(value):
+        # attribute names are stored once and referenced by index
+        names = dict()
+        entries = list()
+        for dn, attrs in value:
+            packed = list()
+            for name, values in attrs.iteritems():
+                index = names.get(name)
+                if index is None:
+                    index = names[name] = len(names)
+                packed.append((index, values))
+            entries.append((dn, tuple(packed)))
+        table = [None] * len(names)
+        for name, index in names.iteritems():
+            table[index] = name
+        return ('r', tuple(table), entries)
+    if isinstance(value, tuple):
+        return ('t', tuple([_pack(_) for _ in value]))
+    try:
+        marshal.dumps(value)
+    except ValueError:
+        return ('p', cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL))
+    return ('v', value)
+
+
+def _unpack(packed):
+    kind = packed[0]
+    if kind == 'r':
+        table = packed[1]
+        return [
+            (dn, dict([(table[index], values) for index, values in attrs]))
+            for dn, attrs in packed[2]
+        ]
+    if kind == 't':
+        return tuple([_unpack(_) for _ in packed[1]])
+    if kind == 'v':
+        return packed[1]
+    if kind == 'p':
+        return cPickle.loads(packed[1])
+    raise SerializationError(u"Unknown kind '{0}'".format(kind))
+
+
+def dumps(value, compress_threshold=COMPRESS_THRESHOLD):
+    """Serialize value to a compact string.
+
+    Search results, i.e. lists of ``(dn, attrs)`` tuples, are stored with
+    attribute names interned. Other values are marshaled if possible and
+    pickled otherwise. Data exceeding ``compress_threshold`` bytes gets
+    compressed. ``None`` disables compression.
+
+    Serialized data is only readable by the same Python version.
+    """
+    try:
+        data = marshal.dumps(_pack(value))
+    except ValueError:
+        # value contains objects not supported by marshal
+        data = marshal.dumps(
+            ('p', cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL))
+        )
+    flags = 0
+    if compress_threshold is not None and len(data) >= compress_threshold:
+        data = zlib.compress(data, 1)
+        flags |= COMPRESSED
+    return '{0}{1}{2}'.format(MAGIC, chr(flags), data)
+
+
+def loads(data):
+    """Deserialize string created by ``dumps``.
+
+    Raise ``SerializationError`` on invalid data.
+    """
+    if not isinstance(data, str) or len(data) <= len(MAGIC) \
+            or not data.startswith(MAGIC):
+        raise SerializationError(u"Invalid data")
+    flags = ord(data[len(MAGIC)])
+    data = data[len(MAGIC) + 1:]
+    try:
+        if flags & COMPRESSED:
+            data = zlib.decompress(data)
+        return _unpack(marshal.loads(data))
+    except (ValueError, EOFError, TypeError, IndexError, zlib.error), e:
+        raise SerializationError(str(e))
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+import logging
+import random
+import threading
+import time
+
+
+logger = logging.getLogger('node.ext.ldap')
+
+
+class LDAPServer(object):
+    """LDAP server state.
+    """
+
+    def __init__(self, uri, priority=0, weight=1):
+        """
+        uri
+            LDAP URI of the server.
+
+        priority
+            Servers with lower priority value are preferred.
+
+        weight
+            Relative weight for load balancing between healthy servers with
+            same priority.
+        """
+        self.uri = uri
+        self.priority = priority
+        self.weight = weight
+        self.healthy = True
+        self.failures = 0
+        self.last_failure = None
+
+    def __repr__(self):
+        return '<LDAPServer {0} priority={1} weight={2} healthy={3}>'.format(
+            self.uri, self.priority, self.weight, self.healthy
+        )
+
+
+def parse_servers(uris):
+    """Create list of ``LDAPServer`` instances.
+
+    uris
+        List of LDAP URIs or ``(uri, priority, weight)`` tuples. Priority and
+        weight are optional in tuples. Servers without priority get their
+        list position as priority.
+    """
+    servers = list()
+    for index, definition in enumerate(uris):
+        if isinstance(definition, basestring):
+            definition = (definition,)
+        uri = definition[0]
+        priority = definition[1] if len(definition) > 1 else index
+        weight = definition[2] if len(definition) > 2 else 1
+        servers.append(LDAPServer(uri, priority=priority, weight=weight))
+    return servers
+
+
+class LDAPServers(object):
+    """Thread safe list of LDAP servers providing failover and load balancing.
+
+    Servers marked down get probed in a background thread every
+    ``retry_delay`` seconds until they are reachable again. Probing only
+    happens if more than one server is configured.
+    """
+
+    def __init__(self, servers, retry_delay=10.0, probe=None):
+        """
+        servers
+            List of ``LDAPServer`` instances.
+
+        retry_delay
+            Seconds between two probe trials of servers marked down.
+
+        probe
+            Callable accepting an URI and returning a boolean whether the
+            server is reachable. If None, servers never get probed and stay
+            down until a connection could be established again.
+        """
+        if not servers:
+            raise ValueError(u"At least one LDAP server required.")
+        self.servers = servers
+        self.retry_delay = retry_delay
+        self._probe = probe
+        self._lock = threading.RLock()
+        self._prober = None
+        self._stop = threading.Event()
+
+    def select(self, exclude=()):
+        """Return server to connect to.
+
+        Healthy servers with lowest priority value are preferred. Between
+        them, one is chosen randomly by weight. If no healthy server is
+        available, the server failed least recently is returned in order to
+        try anyway. Returns None if all servers are excluded.
+
+        exclude
+            Servers which should not be returned, e.g. already tried.
+        """
+        with self._lock:
+            candidates = [_ for _ in self.servers if _ not in exclude]
+            if not candidates:
+                return None
+            healthy = [_ for _ in candidates if _.healthy]
+            if not healthy:
+                return min(candidates, key=lambda x: x.last_failure)
+            priority = min([_.priority for _ in healthy])
+            healthy = [_ for _ in healthy if _.priority == priority]
+            total = sum([_.weight for _ in healthy])
+            pick = random.uniform(0, total)
+            for server in healthy:
+                pick -= server.weight
+                if pick <= 0:
+                    return server
+            return healthy[-1]
+
+    def server(self, uri):
+        """Return server by URI or None.
+        """
+        for server in self.servers:
+            if server.uri == uri:
+                return server
+        return None
+
+    def mark_down(self, server):
+        """Mark server unreachable and start probing it in background.
+        """
+        with self._lock:
+            server.failures += 1
+            server.last_failure = time.time()
+            if not server.healthy:
+                return
+            server.healthy = False
+            logger.warning(u"LDAP server {0} marked down.".format(server.uri))
+            # nothing to fail over to with a single server
+            if len(self.servers) < 2:
+                return
+            if self._probe is not None and self._prober is None:
+                self._stop.clear()
+                self._prober = threading.Thread(target=self._run_probe)
+                self._prober.daemon = True
+                self._prober.start()
+
+    def mark_up(self, server):
+        """Mark server reachable.
+        """
+        with self._lock:
+            if server.healthy:
+                return
+            server.healthy = True
+            logger.info(u"LDAP server {0} marked up.".format(server.uri))
+
+    def stop(self):
+        """Stop background probing.
+        """
+        self._stop.set()
+
+    @property
+    def healthy(self):
+        """List of healthy servers.
+        """
+        with self._lock:
+            return [_ for _ in self.servers if _.healthy]
+
+    def _run_probe(self):
+        while not self._stop.wait(self.retry_delay):
+            with self._lock:
+                down = [_ for _ in self.servers if not _.healthy]
+                if not down:
+                    self._prober = None
+                    return
+            for server in down:
+                if self._probe(server.uri):
+                    self.mark_up(server)
+        with self._lock:
+            self._prober = None
@@ -3,6 +3,7 @@ from node.ext.ldap import BASE
 from node.ext.ldap import LDAPCommunicator
 from node.ext.ldap import LDAPConnector
 from node.ext.ldap import testLDAPConnectivity
+from node.ext.ldap import registry
 import ldap
 
 
@@ -12,10 +13,29 @@ class LDAPSession(object):
     all strings must be utf8 encoded!
     """
 
-    def __init__(self, props):
+    def __init__(self, props, shared=False):
+        """
+        props
+            ``LDAPProps`` instance.
+
+        shared
+            Flag whether to use the communicator, and thus the connection
+            pools and the cache, shared between all sessions with equal
+            props. See ``node.ext.ldap.registry``. ``unbind`` of shared
+            sessions does nothing, use ``node.ext.ldap.registry.clear`` to
+            shut down shared communicators.
+        """
         self._props = props
-        connector = LDAPConnector(props=props)
-        self._communicator = LDAPCommunicator(connector)
+        self._baseDN = ''
+        self._shared = shared
+        if shared:
+            self._registry_key = registry.props_key(props)
+            self._communicator = registry.communicator(
+                props, key=self._registry_key
+            )
+        else:
+            connector = LDAPConnector(props=props)
+            self._communicator = LDAPCommunicator(connector)
 
     def checkServerProperties(self):
         """Test if connection can be established.
@@ -27,58 +47,143 @@ class LDAPSession(object):
             return (False, res)
 
     def _get_baseDN(self):
-        baseDN = self._communicator.baseDN
-        return baseDN
+        return self._baseDN
 
     def _set_baseDN(self, baseDN):
         """baseDN must be utf8-encoded.
+
+        The base DN is kept on the session since the communicator might be
+        shared.
         """
-        self._communicator.baseDN = baseDN
+        self._baseDN = baseDN
 
     baseDN = property(_get_baseDN, _set_baseDN)
 
+    def _base(self, baseDN):
+        # explicit base DN or the one of the session
+        if baseDN is None and self._baseDN:
+            return self._baseDN
+        return baseDN
+
     def ensure_connection(self):
-        """If LDAP directory is down, bind again and retry given function.
+        """Bind if not bound yet.
 
-        XXX: * Improve retry logic
-             * Extend LDAPSession object to handle Fallback server(s)
+        Broken connections are replaced by the connection pool, fallback
+        servers are handled by the connector.
         """
-        if self._communicator._con is None:
+        if self._communicator._pool is not None:
+            return
+        if self._shared:
+            # bind under the registry lock, and pick up a new communicator
+            # if the registry has been cleared
+            self._communicator = registry.communicator(
+                self._props, bind=True, key=self._registry_key
+            )
+        else:
             self._communicator.bind()
 
     def search(self, queryFilter='(objectClass=*)', scope=BASE, baseDN=None,
                force_reload=False, attrlist=None, attrsonly=0,
-               page_size=None, cookie=None):
+               page_size=None, cookie=None, timeout=None, sizelimit=None):
+        """Search the directory.
+
+        ``timeout`` and ``sizelimit`` default to ``operation_timeout`` and
+        ``sizelimit`` of the props. Expired requests get abandoned and
+        ``ldap.TIMEOUT`` is raised.
+
+        See ``node.ext.ldap.base.LDAPCommunicator.search`` for details.
+        """
         if not queryFilter:
             # It makes no sense to really pass these to LDAP, therefore, we
             # interpret them as "don't filter" which in LDAP terms is
             # '(objectClass=*)'
             queryFilter = '(objectClass=*)'
         self.ensure_connection()
-        res = self._communicator.search(queryFilter, scope, baseDN,
+        res = self._communicator.search(queryFilter, scope,
+                                        self._base(baseDN),
                                         force_reload, attrlist, attrsonly,
-                                        page_size, cookie)
-        if page_size:
+                                        page_size, cookie, timeout=timeout,
+                                        sizelimit=sizelimit)
+        return self._filter_entries(res)
+
+    def search_iter(self, queryFilter='(objectClass=*)', scope=BASE,
+                    baseDN=None, attrlist=None, attrsonly=0, page_size=None,
+                    timeout=None, sizelimit=None):
+        """Generator yielding search result entries as they arrive.
+
+        If ``page_size`` is given, paging is done internally. Cache is not
+        considered. ``timeout`` applies per page request.
+        """
+        if not queryFilter:
+            queryFilter = '(objectClass=*)'
+        self.ensure_connection()
+        entries = self._communicator.search_iter(
+            queryFilter, scope, self._base(baseDN), attrlist, attrsonly,
+            page_size,
+            timeout=timeout, sizelimit=sizelimit
+        )
+        for entry in entries:
+            # ActiveDirectory returns entries with dn None
+            if entry[0] is not None:
+                yield entry
+
+    def search_many(self, queries, force_reload=False, return_errors=False):
+        """Perform multiple searches at once.
+
+        All requests are sent before waiting for the first response, thus
+        independent lookups cost about one round trip.
+
+        queries
+            List of dicts containing keyword arguments as accepted by
+            ``search``, except ``force_reload``.
+
+        return_errors
+            If True, the LDAP error of failed queries is returned in place of
+            the result. Otherwise the first error gets raised.
+
+        Return list of results in order of queries.
+        """
+        normalized = list()
+        for query in queries:
+            query = dict(query)
+            if not query.get('queryFilter'):
+                query['queryFilter'] = '(objectClass=*)'
+            query.setdefault('scope', BASE)
+            query['baseDN'] = self._base(query.get('baseDN'))
+            normalized.append(query)
+        self.ensure_connection()
+        results = self._communicator.search_many(
+            normalized,
+            force_reload=force_reload,
+            return_errors=return_errors
+        )
+        ret = list()
+        for res in results:
+            if not isinstance(res, Exception):
+                res = self._filter_entries(res)
+            ret.append(res)
+        return ret
+
+    def _filter_entries(self, res):
+        if isinstance(res, tuple):
             res, cookie = res
+            return self._filter_entries(res), cookie
         # ActiveDirectory returns entries with dn None, which can be ignored
-        res = filter(lambda x: x[0] is not None, res)
-        if page_size:
-            return res, cookie
-        return res
+        return filter(lambda x: x[0] is not None, res)
 
-    def add(self, dn, data):
+    def add(self, dn, data, timeout=None):
         self.ensure_connection()
-        self._communicator.add(dn, data)
+        self._communicator.add(dn, data, timeout=timeout)
 
-    def authenticate(self, dn, pw):
-        """Verify credentials, but don't rebind the session to that user
+    def authenticate(self, dn, pw, timeout=None):
+        """Verify credentials, but don't rebind the session to that user.
+
+        Uses pooled authentication connections of the communicator. Raise
+        ``ldap.TIMEOUT`` if the server does not answer within ``timeout``
+        seconds.
         """
-        # Let's bypass connector/communicator until they are sorted out
-        if self._props.ignore_cert:
-            ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
-        con = ldap.initialize(self._props.uri)
         try:
-            con.simple_bind_s(dn, pw)
+            self._communicator.authenticate(dn, pw, timeout=timeout)
         except (ldap.INVALID_CREDENTIALS, ldap.UNWILLING_TO_PERFORM):
             # The UNWILLING_TO_PERFORM event might be thrown, if you query a
             # local user named ``admin``, but the LDAP server is configured to
@@ -88,7 +193,21 @@ class LDAPSession(object):
         else:
             return True
 
-    def modify(self, dn, data, replace=False):
+    @property
+    def auth_stats(self):
+        """Authentication metrics, see
+        ``node.ext.ldap.base.LDAPCommunicator.auth_stats``.
+        """
+        return self._communicator.auth_stats
+
+    @property
+    def hedge_stats(self):
+        """Hedged search metrics, see
+        ``node.ext.ldap.base.LDAPCommunicator.hedge_stats``.
+        """
+        return self._communicator.hedge_stats
+
+    def modify(self, dn, data, replace=False, timeout=None):
         """Modify an existing entry in the directory.
 
         dn
@@ -102,18 +221,103 @@ class LDAPSession(object):
 
         replace
             if set to True, replace entry at DN entirely with data.
+
+        timeout
+            Time span in seconds the operation may take. Defaults to
+            ``operation_timeout`` of the props.
         """
         self.ensure_connection()
-        result = self._communicator.modify(dn, data)
+        result = self._communicator.modify(dn, data, timeout=timeout)
         return result
 
-    def delete(self, dn):
-        self._communicator.delete(dn)
+    def delete(self, dn, timeout=None):
+        self._communicator.delete(dn, timeout=timeout)
 
-    def passwd(self, userdn, oldpw, newpw):
+    def passwd(self, userdn, oldpw, newpw, timeout=None):
         self.ensure_connection()
-        result = self._communicator.passwd(userdn, oldpw, newpw)
+        result = self._communicator.passwd(userdn, oldpw, newpw,
+                                           timeout=timeout)
         return result
 
+    def prime(self, queryFilter, scope, baseDN, res, attrlist=None):
+        """Store search result in cache as if returned by ``search``. See
+        ``node.ext.ldap.base.LDAPCommunicator.prime``.
+        """
+        return self._communicator.prime(queryFilter, scope,
+                                        self._base(baseDN), res,
+                                        attrlist=attrlist)
+
+    def invalidate(self, dn=None, subtree=False):
+        """Evict cached search results which might contain the entry with
+        given DN. See ``node.ext.ldap.base.LDAPCommunicator.invalidate``.
+        """
+        self._communicator.invalidate(dn, subtree=subtree)
+
     def unbind(self):
+        """Unbind the communicator.
+
+        Does nothing for shared sessions, since other sessions still use the
+        communicator.
+        """
+        if self._shared:
+            return
         self._communicator.unbind()
+
+
+class AsyncLDAPSession(LDAPSession):
+    """LDAP Session sending requests without waiting for the response.
+
+    Operations return ``node.ext.ldap.base.LDAPRequest`` instances. Many
+    requests can be in flight on a few pooled connections. Use
+    ``node.ext.ldap.base.wait`` or the request file descriptor to wait for
+    completion without blocking on a single request.
+
+    The search cache is not considered.
+    """
+
+    def search(self, queryFilter='(objectClass=*)', scope=BASE, baseDN=None,
+               attrlist=None, attrsonly=0, page_size=None, cookie=None,
+               timeout=None, sizelimit=None):
+        """Send search request. ``timeout`` and ``sizelimit`` are sent to
+        the server as limits, use ``result(timeout)`` of the returned
+        request for a client side timeout.
+        """
+        if not queryFilter:
+            queryFilter = '(objectClass=*)'
+        self.ensure_connection()
+        request = self._communicator.search_async(
+            queryFilter, scope, self._base(baseDN), attrlist, attrsonly,
+            page_size, cookie, timeout=timeout, sizelimit=sizelimit
+        )
+        return request.add_callback(self._filter_entries)
+
+    def add(self, dn, data):
+        self.ensure_connection()
+        return self._communicator.add_async(dn, data)
+
+    def authenticate(self, dn, pw):
+        """Verify credentials, but don't rebind the session to that user.
+
+        Result of returned request is a boolean.
+        """
+
+        def failed(error):
+            if isinstance(error, (ldap.INVALID_CREDENTIALS,
+                                  ldap.UNWILLING_TO_PERFORM)):
+                return False
+            raise error
+
+        request = self._communicator.authenticate_async(dn, pw)
+        return request.add_callback(lambda res: True, failed)
+
+    def modify(self, dn, data, replace=False):
+        self.ensure_connection()
+        return self._communicator.modify_async(dn, data)
+
+    def delete(self, dn):
+        self.ensure_connection()
+        return self._communicator.delete_async(dn)
+
+    def passwd(self, userdn, oldpw, newpw):
+        self.ensure_connection()
+        return self._communicator.passwd_async(userdn, oldpw, newpw)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+from ldap.ldapobject import SimpleLDAPObject
+from ldap.syncrepl import SyncreplConsumer
+import ldap
+import logging
+import threading
+
+
+logger = logging.getLogger('node.ext.ldap')
+
+
+class SyncConnection(SyncreplConsumer, SimpleLDAPObject):
+    """LDAP connection object dispatching RFC 4533 content synchronization
+    events to a ``LDAPSyncListener``.
+    """
+
+    def __init__(self, uri, listener=None, **kw):
+        SimpleLDAPObject.__init__(self, uri, **kw)
+        self._listener = listener
+
+    def syncrepl_get_cookie(self):
+        return self._listener.cookie
+
+    def syncrepl_set_cookie(self, cookie):
+        self._listener.cookie_changed(cookie)
+
+    def syncrepl_entry(self, dn, attrs, uuid):
+        self._listener.entry_changed(dn, uuid, attrs)
+
+    def syncrepl_present(self, uuids, refreshDeletes=False):
+        self._listener.entries_present(uuids, refreshDeletes)
+
+    def syncrepl_delete(self, uuids):
+        for uuid in uuids:
+            self._listener.entry_deleted(uuid)
+
+    def syncrepl_refreshdone(self):
+        self._listener.refresh_done()
+
+
+class LDAPSyncListener(object):
+    """Background listener following changes in the directory via RFC 4533
+    content synchronization (syncrepl) in refresh and persist mode.
+
+    Cached search results of the communicator which might contain changed
+    entries get evicted as changes arrive, thus changes made by other
+    clients become visible before the cache timeout expires. Requires the
+    ``syncprov`` overlay or equivalent on the server.
+
+    After the initial refresh and after each reconnect all cached search
+    results get evicted, since changes might have been missed.
+    """
+
+    def __init__(self, communicator, baseDN, scope=ldap.SCOPE_SUBTREE,
+                 queryFilter='(objectClass=*)', retry_delay=10.0,
+                 poll_interval=1.0, attrlist=None):
+        """
+        communicator
+            ``LDAPCommunicator`` instance whose cache gets invalidated.
+
+        baseDN
+            Base DN to follow changes of.
+
+        scope
+            Search scope, defaults to ``SUBTREE``.
+
+        queryFilter
+            Filter for entries to follow changes of.
+
+        retry_delay
+            Seconds to wait before reconnecting after an error.
+
+        poll_interval
+            Seconds between checks whether the listener was stopped.
+
+        attrlist
+            Attributes of changed entries to receive. Defaults to none.
+        """
+        self.communicator = communicator
+        self.baseDN = baseDN
+        self.scope = scope
+        self.queryFilter = queryFilter
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.attrlist = attrlist or ['1.1']
+        self.cookie = None
+        self._dns = dict()
+        self._refreshed = False
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = dict(changed=0, deleted=0, refreshed=0, errors=0)
+
+    def start(self):
+        """Start listening in a background thread.
+        """
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop listening. Wait up to ``timeout`` seconds for the background
+        thread to finish.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def refreshed(self):
+        """Flag whether initial refresh is done and changes are followed.
+        """
+        return self._refreshed
+
+    @property
+    def stats(self):
+        """Dict containing counts of processed events.
+        """
+        return dict(self._stats)
+
+    def cookie_changed(self, cookie):
+        """Called if server sends a new synchronization cookie.
+        """
+        self.cookie = cookie
+
+    def entry_changed(self, dn, uuid, attrs=None):
+        """Called for added or modified entries. ``attrs`` contains the
+        attributes requested via ``attrlist``.
+        """
+        old_dn = self._dns.get(uuid)
+        self._dns[uuid] = dn
+        if not self._refreshed:
+            return
+        self._stats['changed'] += 1
+        if old_dn is not None and old_dn != dn:
+            # renamed or moved
+            self.communicator.invalidate(old_dn, subtree=True)
+        self.communicator.invalidate(dn)
+
+    def entry_deleted(self, uuid):
+        """Called for deleted entries.
+        """
+        dn = self._dns.pop(uuid, None)
+        if not self._refreshed:
+            return
+        self._stats['deleted'] += 1
+        if dn is None:
+            # unknown entry, evict all
+            self.communicator.invalidate()
+            return
+        self.communicator.invalidate(dn, subtree=True)
+
+    def entries_present(self, uuids, deletes=False):
+        """Called with UUIDs of unchanged entries during refresh. If
+        ``uuids`` is None, the present phase is done and entries not
+        presented are deleted unless ``deletes`` is set, which means
+        deleted entries have been sent explicitly.
+        """
+
+    def refresh_done(self):
+        """Called once refresh phase is done and persist phase begins.
+        """
+        self._stats['refreshed'] += 1
+        self.communicator.invalidate()
+        self._refreshed = True
+
+    def _connect(self):
+        connector = self.communicator._connector
+        return connector.connect(
+            factory=lambda uri: SyncConnection(uri, listener=self)
+        )
+
+    def _run(self):
+        while not self._stop.is_set():
+            con = None
+            # changes might get lost until refreshed again
+            self._refreshed = False
+            try:
+                con = self._connect()
+                msgid = con.syncrepl_search(
+                    self.baseDN,
+                    self.scope,
+                    mode='refreshAndPersist',
+                    filterstr=self.queryFilter,
+                    attrlist=self.attrlist
+                )
+                while not self._stop.is_set():
+                    try:
+                        if not con.syncrepl_poll(msgid=msgid,
+                                                 timeout=self.poll_interval):
+                            logger.warning(
+                                u"LDAP sync search for {0} ended by "
+                                u"server.".format(self.baseDN)
+                            )
+                            break
+                    except ldap.TIMEOUT:
+                        continue
+            except ldap.LDAPError, e:
+                self._stats['errors'] += 1
+                logger.warning(
+                    u"LDAP sync listener for {0} failed: {1}".format(
+                        self.baseDN, e
+                    )
+                )
+            except Exception:
+                self._stats['errors'] += 1
+                logger.exception(
+                    u"LDAP sync listener for {0} failed.".format(self.baseDN)
+                )
+            finally:
+                if con is not None:
+                    try:
+                        con.unbind_s()
+                    except ldap.LDAPError:
+                        pass
+            # reconnect delayed, no matter why the search ended
+            self._stop.wait(self.retry_delay)
@@ -2,6 +2,7 @@
 from node.ext.ldap import LDAPProps
 from node.ext.ldap import ONELEVEL
 from node.ext.ldap import SUBTREE
+from node.ext.ldap import registry
 from node.ext.ldap.ugm import GroupsConfig
 from node.ext.ldap.ugm import UsersConfig
 from odict import odict
@@ -68,8 +69,13 @@ directory   %(dbdir)s
 
 # Indices to maintain
 index       objectClass eq
+index       entryCSN,entryUUID eq
 
 overlay     memberof
+
+# content synchronization for ``node.ext.ldap.sync``
+overlay     syncprov
+syncprov-checkpoint 100 10
 """
 
 
@@ -242,6 +248,8 @@ class Ldif(LDAPLayer):
                    '-w', self['bindpw'], '-H', self['uris']] + dns
             retcode = subprocess.call(cmd, stderr=subprocess.PIPE)
             print "done. %s" % retcode
+        # drop shared connections and cached data of this layer
+        registry.clear()
         for key in ('ucfg', 'gcfg'):
             if key in self:
                 del self[key]
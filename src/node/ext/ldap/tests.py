@@ -9,16 +9,23 @@ import unittest
 
 DOCFILES = [
     ('cache.rst', testing.LDIF_data),
+    ('cachekey.rst', testing.LDIF_data),
+    ('serializer.rst', testing.LDIF_data),
     ('base.rst', testing.LDIF_data),
+    ('pool.rst', testing.LDIF_data),
+    ('servers.rst', testing.LDIF_data),
     ('session.rst', testing.LDIF_data),
     ('filter.rst', testing.LDIF_data),
     ('_node.rst', testing.LDIF_data),
     ('schema.rst', testing.LDIF_data),
+    ('sync.rst', testing.LDIF_data),
+    ('mirror.rst', testing.LDIF_data),
     ('ugm/principals.rst', testing.LDIF_principals),
     ('ugm/groupOfNames.rst', testing.LDIF_groupOfNames),
     ('ugm/posixGroups.rst', testing.LDIF_posixGroups),
     ('ugm/sambaUsers.rst', testing.LDIF_sambaUsers),
     ('ugm/defaults.rst', testing.LDIF_data),
+    ('ugm/warmup.rst', testing.LDIF_principals),
     ('../../../../README.rst', testing.LDIF_data),
 ]
 
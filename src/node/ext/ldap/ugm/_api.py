@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from functools import partial
 from node.behaviors import Adopt
 from node.behaviors import Alias
 from node.behaviors import Attributes
@@ -34,6 +35,7 @@ from plumber import plumbing
 from zope.interface import implementer
 import ldap
 import logging
+import threading
 import time
 
 logger = logging.getLogger('node.ext.ldap')
@@ -371,15 +373,8 @@ class LDAPGroup(LDAPGroupMapping, LDAPPrincipal, UgmGroup):
     def translate_ids(self, members):
         if self._member_format != FORMAT_DN:
             return members
-        principals = self.related_principals()
-        translated = list()
-        for dn in members:
-            try:
-                translated.append(principals.idbydn(dn))
-            except KeyError:
-                # inexistent DN
-                pass
-        return translated
+        # inexistent DN's are skipped
+        return self.related_principals().ids_by_dn(members)
 
     @default
     def translate_key(self, key):
@@ -454,6 +449,26 @@ class LDAPPrincipals(OdictStorage):
         except ldap.NO_SUCH_OBJECT:
             raise KeyError(dn)
 
+    @default
+    def ids_by_dn(self, dns):
+        """Return principal ids for a list of DNs.
+
+        All DNs are looked up at once. Not enlisted DNs are skipped.
+        """
+        search_many = self.context.ldap_session.search_many
+        queries = [dict(baseDN=dn.encode('utf-8')) for dn in dns]
+        ids = list()
+        for res in search_many(queries, return_errors=True):
+            if isinstance(res, ldap.NO_SUCH_OBJECT):
+                continue
+            if isinstance(res, Exception):
+                raise res
+            try:
+                ids.append(res[0][1][self._key_attr][0].decode('utf-8'))
+            except (IndexError, KeyError):
+                continue
+        return ids
+
     @override
     @property
     def ids(self):
@@ -555,6 +570,75 @@ class LDAPPrincipals(OdictStorage):
         except KeyError:
             pass
 
+    @default
+    def warmup(self, progress=None):
+        """Populate the cache with the searches performed when accessing
+        principals by id, by scanning the principals base with paged
+        searches.
+
+        Covers the lookup by id, the lookup by DN and loading of the
+        principal node and its attributes. Only takes effect if caching is
+        enabled.
+
+        progress
+            Callable getting called with the number of processed principals
+            after each page and when done.
+
+        Return number of processed principals.
+        """
+        context = self.context
+        session = context.ldap_session
+        if not session._communicator._cache:
+            return 0
+        queryFilter, _ = context._search_query(
+            None, None, None, None, None, False, None, None
+        )
+        baseDN = context.DN.encode('utf-8')
+        page_size = session._props.page_size
+        entries = session.search_iter(
+            queryFilter,
+            context.search_scope,
+            baseDN=baseDN,
+            page_size=page_size
+        )
+        count = 0
+        for dn, attrs in entries:
+            self._warmup_entry(dn, attrs)
+            count += 1
+            if progress is not None and count % page_size == 0:
+                progress(count)
+        if progress is not None:
+            progress(count)
+        return count
+
+    @default
+    def _warmup_entry(self, dn, attrs):
+        # store results of searches performed when accessing principal
+        ids = attrs.get(self._key_attr)
+        if not ids:
+            return
+        context = self.context
+        session = context.ldap_session
+        queryFilter, attrlist = context._search_query(
+            None, {self._key_attr: ids[0].decode('utf-8')},
+            ['rdn', self._key_attr], None, None, False, None, None
+        )
+        requested = [_.lower() for _ in attrlist]
+        selected = dict([(name, value) for name, value in attrs.items()
+                         if name.lower() in requested])
+        # ``__getitem__``
+        session.prime(queryFilter, context.search_scope,
+                      context.DN.encode('utf-8'), [(dn, selected)],
+                      attrlist=attrlist)
+        # ``idbydn`` and ``ids_by_dn``
+        session.prime('(objectClass=*)', BASE, dn, [(dn, attrs)])
+        # child lookup of ``LDAPNode.__getitem__``
+        session.prime('(objectClass=*)', BASE, dn, [(dn, dict())],
+                      attrlist=[''])
+        # ``LDAPNodeAttributes.load``
+        session.prime('(objectClass=*)', BASE, dn, [(dn, attrs)],
+                      attrlist=['*'])
+
     @default
     @locktree
     def __call__(self):
@@ -894,18 +978,10 @@ class LDAPRole(LDAPGroupMapping, AliasedPrincipal):
             ugm = self.parent.parent
             users = ugm.users
             groups = ugm.groups
-            user_members = list()
-            for dn in members:
-                try:
-                    user_members.append(users.idbydn(dn, True))
-                except KeyError:
-                    pass
-            group_members = list()
-            for dn in members:
-                try:
-                    group_members.append('group:%s' % groups.idbydn(dn, True))
-                except KeyError:
-                    pass
+            user_members = users.ids_by_dn(members)
+            group_members = [
+                'group:%s' % gid for gid in groups.ids_by_dn(members)
+            ]
             members = user_members + group_members
         return members
 
@@ -1066,6 +1142,44 @@ class LDAPUgm(UgmBase):
     def roles_storage(self):
         return self._roles
 
+    @default
+    def warmup(self, progress=None, background=False):
+        """Populate the cache with users, groups and roles. See
+        ``LDAPPrincipals.warmup``.
+
+        progress
+            Callable getting called with the name of the principals container
+            and the number of processed principals.
+
+        background
+            Flag whether to run in a daemon thread. If True, the thread is
+            returned.
+
+        Return dict containing the number of processed principals per
+        container.
+        """
+        if background:
+            thread = threading.Thread(
+                target=self.warmup,
+                kwargs=dict(progress=progress)
+            )
+            thread.daemon = True
+            thread.start()
+            return thread
+        containers = [('users', self.users), ('groups', self.groups)]
+        if self.rcfg is not None and self.roles_storage is not None:
+            containers.append(('roles', self.roles_storage))
+        counts = dict()
+        for name, principals in containers:
+            callback = None
+            if progress is not None:
+                callback = partial(progress, name)
+            counts[name] = principals.warmup(progress=callback)
+            logger.info(u"Warmed up cache with {0} {1}".format(
+                counts[name], name
+            ))
+        return counts
+
     @default
     @locktree
     def roles(self, principal):
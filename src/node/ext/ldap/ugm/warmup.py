@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+from node.ext.ldap.cache import ChunkedCacheProviderFactory
+from node.ext.ldap.cache import MemcachedProviderFactory
+from node.ext.ldap.interfaces import ICacheProviderFactory
+from node.ext.ldap.properties import LDAPProps
+from node.ext.ldap.scope import ONELEVEL
+from node.ext.ldap.scope import SUBTREE
+from node.ext.ldap.ugm._api import GroupsConfig
+from node.ext.ldap.ugm._api import Ugm
+from node.ext.ldap.ugm._api import UsersConfig
+from zope.component import provideUtility
+import argparse
+import sys
+
+
+parser = argparse.ArgumentParser(
+    description='Warm up shared LDAP cache with users and groups.'
+)
+parser.add_argument('--uri', required=True, help='LDAP server URI')
+parser.add_argument('--user', default='', help='bind DN')
+parser.add_argument('--password', default='', help='bind password')
+parser.add_argument(
+    '--memcached',
+    nargs='+',
+    required=True,
+    metavar='SERVER',
+    help='memcached servers as host:port'
+)
+parser.add_argument(
+    '--chunked',
+    action='store_true',
+    help='store compact serialized and chunked values, see ChunkedCache'
+)
+parser.add_argument(
+    '--timeout',
+    type=int,
+    default=43200,
+    help='cache timeout in seconds'
+)
+parser.add_argument('--page-size', type=int, default=1000)
+parser.add_argument('--users-base', required=True, help='users base DN')
+parser.add_argument('--users-filter', default='', help='users query filter')
+parser.add_argument('--users-id', default='uid', help='users id attribute')
+parser.add_argument(
+    '--users-class',
+    nargs='+',
+    default=['inetOrgPerson'],
+    help='users object classes'
+)
+parser.add_argument('--groups-base', help='groups base DN')
+parser.add_argument('--groups-filter', default='', help='groups query filter')
+parser.add_argument('--groups-id', default='cn', help='groups id attribute')
+parser.add_argument(
+    '--groups-class',
+    nargs='+',
+    default=['groupOfNames'],
+    help='groups object classes'
+)
+parser.add_argument(
+    '--subtree',
+    action='store_true',
+    help='search subtree of bases instead of one level'
+)
+
+
+def principals_config(factory, baseDN, queryFilter, id_attr, object_classes,
+                      scope):
+    attrmap = {
+        'id': id_attr,
+        'rdn': id_attr,
+        'login': id_attr,
+    }
+    return factory(
+        baseDN=baseDN,
+        attrmap=attrmap,
+        scope=scope,
+        queryFilter=queryFilter,
+        objectClasses=object_classes,
+        strict=False,
+    )
+
+
+def main(argv=None, factory=None):
+    """Warm up the shared cache from command line.
+
+    Only makes sense with a cache shared between processes, thus memcached
+    servers are required.
+
+    argv
+        Command line arguments. Defaults to ``sys.argv``.
+
+    factory
+        Cache provider factory used instead of the one connecting to the
+        memcached servers, e.g. for testing.
+    """
+    ns = parser.parse_args(argv)
+    if factory is None:
+        factory = MemcachedProviderFactory(servers=ns.memcached)
+    if ns.chunked:
+        factory = ChunkedCacheProviderFactory(factory=factory)
+    provideUtility(factory, ICacheProviderFactory)
+    props = LDAPProps(
+        uri=ns.uri,
+        user=ns.user,
+        password=ns.password,
+        cache=True,
+        timeout=ns.timeout,
+        page_size=ns.page_size,
+    )
+    scope = ns.subtree and SUBTREE or ONELEVEL
+    ucfg = principals_config(UsersConfig, ns.users_base, ns.users_filter,
+                             ns.users_id, ns.users_class, scope)
+    gcfg = None
+    if ns.groups_base:
+        gcfg = principals_config(GroupsConfig, ns.groups_base,
+                                 ns.groups_filter, ns.groups_id,
+                                 ns.groups_class, scope)
+    ugm = Ugm(props=props, ucfg=ucfg, gcfg=gcfg, rcfg=None)
+
+    def progress(name, count):
+        sys.stdout.write(u'{0}: {1}\n'.format(name, count))
+        sys.stdout.flush()
+
+    users = ugm.users.warmup(progress=lambda count: progress('users', count))
+    groups = 0
+    if gcfg is not None:
+        groups = ugm.groups.warmup(
+            progress=lambda count: progress('groups', count)
+        )
+    sys.stdout.write(u'Warmed up {0} users and {1} groups.\n'.format(
+        users, groups
+    ))